@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark wygładzania oczu w get_ocular_bad_epochs: pierwotne np.apply_along_axis + np.convolve
+vs moving_average (uniform_filter1d) dla 1k i 10k epok (2 kanały oczne, okno artefaktu 0–600 ms, 400 Hz).
+
+    python -m benchmarks.bench_moving_average
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from src.erp.artifacts import moving_average
+
+
+def _reference(x, window):
+    return np.apply_along_axis(lambda r: np.convolve(r, np.ones(window) / window, mode="same"), -1, x)
+
+
+def _best_of(fn, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--epochs", type=int, nargs="*", default=[1000, 10000])
+    parser.add_argument("--window", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+    rng = np.random.default_rng(0)
+    print(f"{'Epoki':>7} {'convolve_s':>11} {'moving_average_s':>17} {'Przyspieszenie':>15} {'Maks_różnica':>13}")
+    for n in args.epochs:
+        x = rng.standard_normal((n, 2, 241)) * 20e-6
+        t_ref = _best_of(lambda: _reference(x, args.window), args.repeat)
+        t_new = _best_of(lambda: moving_average(x, args.window), args.repeat)
+        diff = np.abs(moving_average(x, args.window) - _reference(x, args.window)).max()
+        print(f"{n:7d} {t_ref:11.4f} {t_new:17.4f} {t_ref / t_new:14.0f}× {diff:13.2e}")
+
+
+if __name__ == "__main__":
+    main()
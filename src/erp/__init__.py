@@ -8,22 +8,82 @@ from .constants import (
     EVENT_MAPPING,
     EVENT_DICT,
     KANALY_OCZNE,
+    HOMOLOGOUS_PAIRS,
+    ADJACENCY_10_20,
+    CLUSTER_N_PERM,
+    CLUSTER_ALPHA,
+    CLUSTER_MAX_MEMORY_MB,
     PEAK_WINDOWS,
+    VALIDATED_PEAK_PARAMS,
+    JACKKNIFE_FRACTION,
+    OCULAR_PERCENTILE,
+    OCULAR_THRESHOLD_LIMITS,
+    ARTIFACT_DETECTOR_PARAMS,
+    ERP_FIGURE_PROFILES,
+    BOOTSTRAP_N,
+    BOOTSTRAP_CI,
+    BOOTSTRAP_MAX_MEMORY_MB,
 )
-from .io_spike2 import load_smr_block, shift_events_42ms
+from .io_spike2 import load_smr_block, event_time_window, shift_events_42ms
 from .raw_mne import block_to_raw
-from .events import build_events
+from .events import build_events, apply_monitor_delay, detect_photodiode_onsets, photodiode_delays
 from .epochs_mne import uv_to_v_if_needed, create_epochs, drop_channel
+from .epochs_stream import epoch_windows, iter_epoch_batches, epochs_from_stream
 from .artifacts import (
+    epochs_data_view,
     ptp_stats,
     get_ocular_bad_epochs,
+    ocular_threshold_sweep,
+    cohort_threshold_sweep,
+    export_rejected_epochs,
     drop_bad_epochs,
+    ARTIFACT_DETECTORS,
+    detect_artifacts,
+    artifact_reasons,
+    drop_detected,
     run_artifact_rejection,
+    rejection_report,
+    plot_rejection_report,
     drop_log_stats,
+    ocular_max_ptp,
 )
-from .erp import compute_evokeds, plot_all_erp, get_global_ylim
-from .peaks import find_peaks_simple, find_peaks_validated, save_peak_tables
+from .selection import MaskedEpochs, mask_bad_epochs, epochs_buffer
+from .online import P2Quantile, OnlineOcularDetector
+from .cache import open_smr_cache, load_smr_cached, evict_smr_cache
+from .erp import (
+    compute_evokeds,
+    grouped_average,
+    grouped_sums,
+    condition_groups,
+    plot_all_erp,
+    get_global_ylim,
+    ErpFigureTemplate,
+    export_erp_figures,
+)
+from .bootstrap import BOOTSTRAP_CONTRASTS, bootstrap_weights, bootstrap_bands
+from .lateralization import lateralized_waves, lateralized_evokeds, lateralized_table
+from .grand_average import EvokedAccumulator, merge_accumulators
+from .peaks import (
+    window_bounds,
+    window_peaks,
+    find_peaks_simple,
+    find_peaks_cohort,
+    validated_peaks,
+    find_peaks_validated,
+    single_trial_peaks,
+    save_peak_tables,
+)
+from .jackknife import window_measures, jackknife_peaks
 from .stats import asymmetry_analysis, full_amplitude_stats
+from .cluster import (
+    channel_adjacency,
+    cluster_test_paired,
+    cluster_test_independent,
+    cluster_test_evokeds,
+    cluster_test_lateralized,
+    cluster_test_epochs,
+    clusters_table,
+)
 
 __all__ = [
     "WRONG_ANS",
@@ -32,25 +92,92 @@ __all__ = [
     "EVENT_MAPPING",
     "EVENT_DICT",
     "KANALY_OCZNE",
+    "HOMOLOGOUS_PAIRS",
+    "ADJACENCY_10_20",
+    "CLUSTER_N_PERM",
+    "CLUSTER_ALPHA",
+    "CLUSTER_MAX_MEMORY_MB",
     "PEAK_WINDOWS",
+    "VALIDATED_PEAK_PARAMS",
+    "JACKKNIFE_FRACTION",
+    "OCULAR_PERCENTILE",
+    "OCULAR_THRESHOLD_LIMITS",
+    "ARTIFACT_DETECTOR_PARAMS",
+    "ERP_FIGURE_PROFILES",
+    "BOOTSTRAP_N",
+    "BOOTSTRAP_CI",
+    "BOOTSTRAP_MAX_MEMORY_MB",
     "load_smr_block",
+    "event_time_window",
     "shift_events_42ms",
     "block_to_raw",
     "build_events",
+    "apply_monitor_delay",
+    "detect_photodiode_onsets",
+    "photodiode_delays",
     "uv_to_v_if_needed",
     "create_epochs",
     "drop_channel",
+    "epoch_windows",
+    "iter_epoch_batches",
+    "epochs_from_stream",
+    "epochs_data_view",
     "ptp_stats",
     "get_ocular_bad_epochs",
+    "ocular_threshold_sweep",
+    "cohort_threshold_sweep",
+    "export_rejected_epochs",
     "drop_bad_epochs",
+    "ARTIFACT_DETECTORS",
+    "detect_artifacts",
+    "artifact_reasons",
+    "drop_detected",
     "run_artifact_rejection",
+    "rejection_report",
+    "plot_rejection_report",
     "drop_log_stats",
+    "ocular_max_ptp",
+    "MaskedEpochs",
+    "mask_bad_epochs",
+    "epochs_buffer",
+    "P2Quantile",
+    "OnlineOcularDetector",
+    "open_smr_cache",
+    "load_smr_cached",
+    "evict_smr_cache",
     "compute_evokeds",
+    "grouped_average",
+    "grouped_sums",
+    "condition_groups",
     "plot_all_erp",
     "get_global_ylim",
+    "ErpFigureTemplate",
+    "export_erp_figures",
+    "BOOTSTRAP_CONTRASTS",
+    "bootstrap_weights",
+    "bootstrap_bands",
+    "lateralized_waves",
+    "lateralized_evokeds",
+    "lateralized_table",
+    "EvokedAccumulator",
+    "merge_accumulators",
+    "window_bounds",
+    "window_peaks",
     "find_peaks_simple",
+    "find_peaks_cohort",
+    "validated_peaks",
     "find_peaks_validated",
+    "single_trial_peaks",
     "save_peak_tables",
+    "window_measures",
+    "jackknife_peaks",
     "asymmetry_analysis",
     "full_amplitude_stats",
+    "channel_adjacency",
+    "cluster_test_paired",
+    "cluster_test_independent",
+    "cluster_test_evokeds",
+    "cluster_test_lateralized",
+    "cluster_test_epochs",
+    "clusters_table",
 ]
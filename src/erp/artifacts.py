@@ -1,56 +1,116 @@
 # -*- coding: utf-8 -*-
 """Odrzucanie artefaktów ocznych i epok z błędnymi odpowiedziami."""
 
+import os
+
 import numpy as np
+import pandas as pd
 import mne
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from scipy.ndimage import uniform_filter1d
 from collections import Counter
 
-from .constants import KANALY_OCZNE, TMIN_ARTEFAKT, TMAX_ARTEFAKT, WRONG_ANS
+from .constants import (
+    KANALY_OCZNE,
+    TMIN_ARTEFAKT,
+    TMAX_ARTEFAKT,
+    WRONG_ANS,
+    OCULAR_PERCENTILE,
+    OCULAR_THRESHOLD_LIMITS,
+    ARTIFACT_DETECTOR_PARAMS,
+)
+
+
+def epochs_data_view(epochs):
+    """
+    Widok danych epok tylko do odczytu (bez kopii) — wspólny dla wszystkich etapów
+    odrzucania artefaktów zamiast kolejnych epochs.get_data().
+    """
+    data = epochs.get_data(copy=False).view()
+    data.flags.writeable = False
+    return data
+
 
+def _time_slice(times, tmin, tmax):
+    """Okno tmin..tmax (włącznie) jako slice — wycinek bez kopii, w przeciwieństwie do maski."""
+    idx = np.flatnonzero((times >= tmin) & (times <= tmax))
+    return slice(idx[0], idx[-1] + 1) if len(idx) else slice(0, 0)
 
-def ptp_stats(epochs_temp, show_hist=True):
-    """Statystyka peak-to-peak dla epok; opcjonalnie histogram."""
-    ptp_data = np.ptp(epochs_temp.get_data(), axis=2)
-    print("\n=== Statystyka peak-to-peak (BEZ F8) ===")
-    print(f"Kanałów w analizie: {ptp_data.shape[1]}")
-    print(f"Mediana:         {np.median(ptp_data)*1e6:.1f} µV")
-    print(f"90. percentyl:   {np.percentile(ptp_data, 90)*1e6:.1f} µV")
-    print(f"95. percentyl:   {np.percentile(ptp_data, 95)*1e6:.1f} µV")
-    print(f"99. percentyl:   {np.percentile(ptp_data, 99)*1e6:.1f} µV")
+
+def moving_average(x, window):
+    """
+    Średnia ruchoma wzdłuż ostatniej osi, równa (do błędu zaokrągleń) np.convolve(x, ones(window)/window,
+    mode="same") dla każdego przebiegu, ale liczona naraz dla całego bloku (epoki × kanały × czas)
+    przez scipy.ndimage.uniform_filter1d: suma bieżąca, więc koszt nie zależy od window;
+    poza sygnałem zera, jak w convolve. Przebiegi nie krótsze niż window.
+    """
+    x = np.asarray(x, dtype=np.result_type(x, np.float64))
+    return uniform_filter1d(x, window, axis=-1, mode="constant", cval=0.0)
+
+
+def ptp_stats(epochs_temp, show_hist=True, verbose=True, data=None):
+    """
+    Statystyka peak-to-peak dla epok; opcjonalnie histogram.
+    data: widok z epochs_data_view (domyślnie tworzony tu, bez kopii).
+    """
+    if data is None:
+        data = epochs_data_view(epochs_temp)
+    ptp_data = np.ptp(data, axis=2)
+    if verbose:
+        p50, p90, p95, p99 = np.percentile(ptp_data, [50, 90, 95, 99]) * 1e6
+        print("\n=== Statystyka peak-to-peak (BEZ F8) ===")
+        print(f"Kanałów w analizie: {ptp_data.shape[1]}")
+        print(f"Mediana:         {p50:.1f} µV")
+        print(f"90. percentyl:   {p90:.1f} µV")
+        print(f"95. percentyl:   {p95:.1f} µV")
+        print(f"99. percentyl:   {p99:.1f} µV")
     if show_hist:
-        plt.figure(figsize=(10, 4))
-        plt.hist(ptp_data.flatten() * 1e6, bins=50, alpha=0.7, edgecolor="black")
-        plt.xlabel("Amplituda peak-to-peak (µV)")
-        plt.ylabel("Liczba")
-        plt.title("Rozkład amplitud peak-to-peak (bez F8)")
-        plt.axvline(np.percentile(ptp_data, 95) * 1e6, color="#606060", linestyle="--",
-                    label=f"95. percentyl ({np.percentile(ptp_data, 95)*1e6:.1f} µV)")
-        plt.axvline(60, color="#707070", linestyle="--", label="Typowy próg (60 µV)")
-        plt.legend()
-        plt.grid(alpha=0.3)
+        plot_ptp_hist(ptp_data)
         plt.show()
     return ptp_data
 
 
-def get_ocular_bad_epochs(epochs_temp, smooth_window=8, verbose=True):
+def plot_ptp_hist(ptp_data):
+    """Histogram amplitud peak-to-peak (wszystkie epoki i kanały). Zwraca figurę."""
+    fig = plt.figure(figsize=(10, 4))
+    plt.hist(ptp_data.flatten() * 1e6, bins=50, alpha=0.7, edgecolor="black")
+    plt.xlabel("Amplituda peak-to-peak (µV)")
+    plt.ylabel("Liczba")
+    plt.title("Rozkład amplitud peak-to-peak (bez F8)")
+    plt.axvline(np.percentile(ptp_data, 95) * 1e6, color="#606060", linestyle="--",
+                label=f"95. percentyl ({np.percentile(ptp_data, 95)*1e6:.1f} µV)")
+    plt.axvline(60, color="#707070", linestyle="--", label="Typowy próg (60 µV)")
+    plt.legend()
+    plt.grid(alpha=0.3)
+    return fig
+
+
+def ocular_max_ptp(data, idx_ocular, times, smooth_window=8):
+    """Maks. (po kanałach ocznych) PtP wygładzonego sygnału w oknie TMIN_ARTEFAKT–TMAX_ARTEFAKT, na epokę."""
+    # Najpierw kanały oczne, potem okno czasu — kopiowany jest tylko ten wycinek
+    data_ocular = data[:, idx_ocular, _time_slice(times, TMIN_ARTEFAKT, TMAX_ARTEFAKT)]
+    smoothed = moving_average(data_ocular, smooth_window)
+    return np.max(np.ptp(smoothed, axis=2), axis=1)
+
+
+def get_ocular_bad_epochs(epochs_temp, smooth_window=8, verbose=True, data=None):
     """
     Zwraca indeksy epok do odrzucenia (artefakty oczne) oraz próg (w V).
     Używa wygładzonego sygnału w oknie TMIN_ARTEFAKT–TMAX_ARTEFAKT.
+    data: widok z epochs_data_view; zwracany jako data_full (bez kopii).
     """
     idx_ocular = [epochs_temp.ch_names.index(ch) for ch in KANALY_OCZNE if ch in epochs_temp.ch_names]
     times = epochs_temp.times
     mask_t = (times >= TMIN_ARTEFAKT) & (times <= TMAX_ARTEFAKT)
-    data_full = epochs_temp.get_data()
-    data_win = data_full[:, :, mask_t]
-    data_ocular = data_win[:, idx_ocular, :]
-    smoothed = np.apply_along_axis(
-        lambda x: np.convolve(x, np.ones(smooth_window) / smooth_window, mode="same"),
-        2, data_ocular,
-    )
-    ptp_ocular = np.ptp(smoothed, axis=2)
-    max_ptp_ocular = np.max(ptp_ocular, axis=1)
-    threshold = np.clip(np.percentile(max_ptp_ocular, 95), 60e-6, 100e-6)
+    if data is None:
+        data = epochs_data_view(epochs_temp)
+    data_full = data
+    max_ptp_ocular = ocular_max_ptp(data_full, idx_ocular, times, smooth_window=smooth_window)
+    threshold = np.clip(np.percentile(max_ptp_ocular, OCULAR_PERCENTILE), *OCULAR_THRESHOLD_LIMITS)
     bad_idx = np.where(max_ptp_ocular > threshold)[0]
     if verbose:
         print(f"\nPróg odrzucania (tylko dla {KANALY_OCZNE}): {threshold*1e6:.1f} µV")
@@ -59,36 +119,102 @@ def get_ocular_bad_epochs(epochs_temp, smooth_window=8, verbose=True):
     return bad_idx, threshold, data_full, times, mask_t, max_ptp_ocular, idx_ocular
 
 
-def plot_rejected_epochs(epochs_temp, bad_idx, threshold, data_full, times, max_ptp_ocular, idx_ocular):
-    """Wizualizacja odrzuconych epok i histogram zaakceptowane vs odrzucone."""
+def _decimate_minmax(x, y, max_points):
+    """
+    Decymacja do rozdzielczości ekranu: w każdym przedziale min i max (piki artefaktów
+    pozostają widoczne). y: (..., czas). Zwraca (x, y) z <= ~max_points próbkami.
+    """
+    n = y.shape[-1]
+    if max_points is None or n <= max_points or max_points < 2:
+        return x, y
+    size = int(np.ceil(n / (max_points // 2)))
+    n_bins = n // size
+    yb = y[..., :n_bins * size].reshape(y.shape[:-1] + (n_bins, size))
+    xb = x[:n_bins * size].reshape(n_bins, size)
+    y_out = np.stack([yb.min(axis=-1), yb.max(axis=-1)], axis=-1).reshape(y.shape[:-1] + (2 * n_bins,))
+    x_out = np.repeat(xb.mean(axis=-1), 2)
+    return x_out, y_out
+
+
+def _draw_rejected_page(fig, page_idx, ch_names, threshold, data_full, times, max_ptp_ocular, idx_ocular,
+                        max_points=None):
+    """Rysuje stronę odrzuconych epok: wszystkie kanały jednej epoki jako dwie kolekcje linii."""
+    axes = fig.subplots(len(page_idx), 1, squeeze=False)[:, 0]
+    other = [i for i in range(len(ch_names)) if i not in idx_ocular]
+    colors = [f"C{k}" for k in range(len(idx_ocular))]
+    handles = [Line2D([], [], color=c, linewidth=2, label=ch_names[i]) for c, i in zip(colors, idx_ocular)]
+    for ax, ix in zip(axes, page_idx):
+        times_ms, dat = _decimate_minmax(times * 1000, data_full[ix] * 1e6, max_points)
+        segs = np.stack([np.broadcast_to(times_ms, dat.shape), dat], axis=-1)
+        ax.add_collection(LineCollection(segs[other], colors="gray", alpha=0.3, linewidths=0.5))
+        ax.add_collection(LineCollection(segs[idx_ocular], colors=colors, alpha=0.9, linewidths=2))
+        ax.autoscale_view()
+        ax.axvspan(TMIN_ARTEFAKT*1000, TMAX_ARTEFAKT*1000, alpha=0.1, color="gray")
+        ax.axhline(threshold*1e6, color="#606060", linestyle="--", linewidth=2)
+        ax.axhline(-threshold*1e6, color="#606060", linestyle="--", linewidth=2)
+        ax.set_xlim(-200, 800)
+        ax.set_xlabel("Czas (ms)")
+        ax.set_ylabel("Amplituda (µV)")
+        ax.set_title(f"Odrzucona epoka #{ix} (maks. PtP oczny: {max_ptp_ocular[ix]*1e6:.1f} µV)")
+        ax.legend(handles=handles, loc="upper right", fontsize=8)
+        ax.grid(alpha=0.3)
+    fig.tight_layout()
+
+
+def plot_rejected_epochs(epochs_temp, bad_idx, threshold, data_full, times, max_ptp_ocular, idx_ocular,
+                         per_page=10, max_points=2000, show=True):
+    """
+    Wizualizacja odrzuconych epok (strony po per_page epok) i histogram zaakceptowane vs odrzucone.
+    max_points: decymacja min/max do rozdzielczości ekranu (None = wszystkie próbki).
+    show=False: figury nie są wyświetlane (plt.show). Zwraca listę figur (strony + histogram).
+    """
+    figs = []
     if len(bad_idx) == 0:
-        return
-    KANALY_OCZNE = list(np.array(epochs_temp.ch_names)[idx_ocular]) if idx_ocular else []
-    mask_t = (times >= TMIN_ARTEFAKT) & (times <= TMAX_ARTEFAKT)
-    n_show = len(bad_idx)
-    fig, axes = plt.subplots(n_show, 1, figsize=(14, 3 * n_show))
-    if n_show == 1:
-        axes = [axes]
-    for i, ix in enumerate(bad_idx):
-        dat = data_full[ix, :, :] * 1e6
-        for ch_i, ch_name in enumerate(epochs_temp.ch_names):
-            if ch_name in KANALY_OCZNE:
-                axes[i].plot(times * 1000, dat[ch_i, :], label=ch_name, linewidth=2, alpha=0.9)
-            else:
-                axes[i].plot(times * 1000, dat[ch_i, :], color="gray", alpha=0.3, linewidth=0.5)
-        axes[i].axvspan(TMIN_ARTEFAKT*1000, TMAX_ARTEFAKT*1000, alpha=0.1, color="gray")
-        axes[i].axhline(threshold*1e6, color="#606060", linestyle="--", linewidth=2)
-        axes[i].axhline(-threshold*1e6, color="#606060", linestyle="--", linewidth=2)
-        axes[i].set_xlim(-200, 800)
-        axes[i].set_xlabel("Czas (ms)")
-        axes[i].set_ylabel("Amplituda (µV)")
-        axes[i].set_title(f"Odrzucona epoka #{ix} (maks. PtP oczny: {max_ptp_ocular[ix]*1e6:.1f} µV)")
-        axes[i].legend(loc="upper right", fontsize=8)
-        axes[i].grid(alpha=0.3)
-    plt.tight_layout()
-    plt.show()
-    good_idx = np.setdiff1d(np.arange(len(epochs_temp.events)), bad_idx)
-    fig, ax = plt.subplots(1, 1, figsize=(10, 5))
+        return figs
+    for start in range(0, len(bad_idx), per_page):
+        page = bad_idx[start:start + per_page]
+        fig = plt.figure(figsize=(14, 3 * len(page)))
+        _draw_rejected_page(fig, page, epochs_temp.ch_names, threshold, data_full, times,
+                            max_ptp_ocular, idx_ocular, max_points=max_points)
+        figs.append(fig)
+        if show:
+            plt.show()
+    figs.append(plot_ocular_hist(max_ptp_ocular, bad_idx, threshold))
+    if show:
+        plt.show()
+    return figs
+
+
+def export_rejected_epochs(ch_names, bad_idx, threshold, data_full, times, max_ptp_ocular, idx_ocular,
+                           output_dir, prefix="rejected", per_page=10, max_points=1000, fmt="png", dpi=100):
+    """
+    Zapis odrzuconych epok do plików (strony po per_page epok) + histogram oczny,
+    bez pyplot i bez okien (Figure + Agg) — do raportów QA w przetwarzaniu wsadowym.
+    Zwraca listę ścieżek.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for page_no, start in enumerate(range(0, len(bad_idx), per_page), start=1):
+        page = bad_idx[start:start + per_page]
+        fig = Figure(figsize=(14, 3 * len(page)))
+        FigureCanvasAgg(fig)
+        _draw_rejected_page(fig, page, ch_names, threshold, data_full, times,
+                            max_ptp_ocular, idx_ocular, max_points=max_points)
+        path = os.path.join(output_dir, f"{prefix}_{page_no:03d}.{fmt}")
+        fig.savefig(path, dpi=dpi)
+        paths.append(path)
+    fig = Figure(figsize=(10, 5))
+    FigureCanvasAgg(fig)
+    _draw_ocular_hist(fig.subplots(), max_ptp_ocular, bad_idx, threshold)
+    fig.tight_layout()
+    path = os.path.join(output_dir, f"{prefix}_hist.{fmt}")
+    fig.savefig(path, dpi=dpi)
+    paths.append(path)
+    return paths
+
+
+def _draw_ocular_hist(ax, max_ptp_ocular, bad_idx, threshold):
+    good_idx = np.setdiff1d(np.arange(len(max_ptp_ocular)), bad_idx)
     ax.hist(max_ptp_ocular[good_idx] * 1e6, bins=30, alpha=0.6, label=f"Zaakceptowane ({len(good_idx)})", color="#909090", edgecolor="#707070")
     ax.hist(max_ptp_ocular[bad_idx] * 1e6, bins=30, alpha=0.6, label=f"Odrzucone ({len(bad_idx)})", color="red", edgecolor="black")
     ax.axvline(threshold*1e6, color="#606060", linestyle="--", linewidth=2, label=f"Próg ({threshold*1e6:.1f} µV)")
@@ -97,19 +223,202 @@ def plot_rejected_epochs(epochs_temp, bad_idx, threshold, data_full, times, max_
     ax.set_title("Rozkład artefaktów ocznych: Zaakceptowane vs Odrzucone epoki")
     ax.legend(fontsize=10)
     ax.grid(alpha=0.3)
+
+
+def plot_ocular_hist(max_ptp_ocular, bad_idx, threshold):
+    """Histogram maks. PtP w kanałach ocznych: zaakceptowane vs odrzucone epoki. Zwraca figurę."""
+    fig, ax = plt.subplots(1, 1, figsize=(10, 5))
+    _draw_ocular_hist(ax, max_ptp_ocular, bad_idx, threshold)
     plt.tight_layout()
-    plt.show()
+    return fig
+
+
+def _stat_ptp(data, stats):
+    if "ptp" not in stats:
+        stats["ptp"] = np.ptp(data, axis=2)
+    return stats["ptp"]
+
+
+def _detect_ptp(data, sfreq, stats, threshold):
+    return _stat_ptp(data, stats) > threshold
+
+
+def _detect_flat(data, sfreq, stats, threshold):
+    return _stat_ptp(data, stats) < threshold
+
+
+def _detect_gradient(data, sfreq, stats, threshold, chunk=256):
+    out = np.empty(data.shape[:2], dtype=bool)
+    for i in range(0, len(data), chunk):
+        grad = np.diff(data[i:i + chunk], axis=2)
+        np.abs(grad, out=grad)
+        out[i:i + chunk] = grad.max(axis=2) > threshold
+    return out
+
+
+def _detect_step(data, sfreq, stats, threshold, window, chunk=256):
+    """
+    Maks. różnica średnich dwóch sąsiednich połówek okna, z sumy kumulacyjnej c:
+    |c[t+2h] − 2·c[t+h] + c[t]| / h — bez pętli po pozycjach okna.
+    """
+    half = max(int(round(window * sfreq / 2)), 1)
+    out = np.zeros(data.shape[:2], dtype=bool)
+    if data.shape[2] < 2 * half:
+        return out
+    for i in range(0, len(data), chunk):
+        block = data[i:i + chunk]
+        csum = np.zeros(block.shape[:2] + (block.shape[2] + 1,))
+        np.cumsum(block, axis=2, out=csum[:, :, 1:])
+        step = csum[:, :, 2 * half:] + csum[:, :, :-2 * half]
+        step -= 2 * csum[:, :, half:-half]
+        np.abs(step, out=step)
+        out[i:i + chunk] = step.max(axis=2) / half > threshold
+    return out
+
+
+def _detect_zscore(data, sfreq, stats, threshold):
+    """Odporny z-score (mediana, MAD) PtP każdego kanału względem wszystkich epok."""
+    ptp = _stat_ptp(data, stats)
+    med = np.median(ptp, axis=0)
+    mad = 1.4826 * np.median(np.abs(ptp - med), axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (ptp - med) / mad
+    return np.nan_to_num(z, nan=0.0) > threshold
+
+
+# Rejestr detektorów: nazwa -> funkcja(data, sfreq, stats, **params) -> (epoki × kanały) bool
+ARTIFACT_DETECTORS = {
+    "ptp": _detect_ptp,
+    "step": _detect_step,
+    "flat": _detect_flat,
+    "gradient": _detect_gradient,
+    "zscore": _detect_zscore,
+}
+
+
+def detect_artifacts(data, sfreq, detectors=None, params=None, times=None, window=None, picks=None):
+    """
+    Uruchamia detektory artefaktów na bloku (epoki × kanały × czas) — każdy wektorowo dla
+    wszystkich epok i kanałów, ze wspólnymi statystykami (np. PtP liczone raz).
+    detectors: nazwy z ARTIFACT_DETECTORS (domyślnie wszystkie); params: nadpisania
+    ARTIFACT_DETECTOR_PARAMS, np. {"ptp": {"threshold": 80e-6}}.
+    window: (tmin, tmax) w s (wymaga times); picks: indeksy kanałów.
+    Zwraca (mask, names): mask (epoki × detektory × kanały) bool.
+    """
+    names = list(ARTIFACT_DETECTORS) if detectors is None else list(detectors)
+    params = params or {}
+    if picks is not None:
+        data = data[:, picks]
+    if window is not None:
+        data = data[:, :, _time_slice(times, *window)]
+    stats = {}
+    mask = np.zeros((data.shape[0], len(names), data.shape[1]), dtype=bool)
+    for i, name in enumerate(names):
+        kw = {**ARTIFACT_DETECTOR_PARAMS.get(name, {}), **params.get(name, {})}
+        mask[:, i, :] = ARTIFACT_DETECTORS[name](data, sfreq, stats, **kw)
+    return mask, names
+
+
+def artifact_reasons(mask, names):
+    """Przyczyny odrzucenia każdej epoki z maski detect_artifacts: {indeks: ["PTP", ...]}."""
+    hits = mask.any(axis=2)
+    return {int(ix): [names[j].upper() for j in np.flatnonzero(hits[ix])] for ix in np.flatnonzero(hits.any(axis=1))}
+
+
+def drop_detected(epochs, mask, names, selection=None, verbose=True):
+    """
+    Usuwa (w miejscu) epoki wykryte przez detect_artifacts, wpisując nazwy detektorów
+    do epochs.drop_log. selection: epochs.selection obiektu, na którym liczono maskę
+    (gdy epochs jest już po wcześniejszym odrzucaniu). Zwraca epochs.
+    """
+    reasons = artifact_reasons(mask, names)
+    if selection is None:
+        selection = epochs.selection
+    groups = {}
+    for ix, why in reasons.items():
+        groups.setdefault(tuple(why), []).append(selection[ix])
+    for why, orig in groups.items():
+        present = np.isin(epochs.selection, orig)
+        if present.any():
+            epochs.drop(np.flatnonzero(present), reason=list(why), verbose=None if verbose else False)
+    return epochs
+
+
+def ocular_threshold_sweep(max_ptp_ocular, thresholds, event_codes, event_dict, wrong_ans=None, selection=None):
+    """
+    Liczba odrzuconych epok i retencja w każdym warunku dla wielu progów naraz.
+    max_ptp_ocular sortowane raz (osobno w każdym warunku), progi przez searchsorted —
+    O(n log n + k log n) zamiast k wywołań get_ocular_bad_epochs.
+    Epoka jest odrzucana, gdy max_ptp_ocular > próg (jak w get_ocular_bad_epochs).
+    event_codes: epochs_temp.events[:, 2]; wrong_ans: pierwotne indeksy zdarzeń (jak WRONG_ANS)
+    wykluczanych niezależnie od progu, mapowane przez selection (epochs_temp.selection;
+    None = epoki bez luk, pozycja = indeks zdarzenia).
+    Zwraca DataFrame: wiersz na próg, kolumny Próg_uV, Odrzucone, Zaakceptowane, Retencja_%,
+    <warunek>_n / <warunek>_%, Balans (min/max liczby prób w warunkach), Valid_Invalid.
+    """
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=float))
+    max_ptp_ocular = np.asarray(max_ptp_ocular)
+    codes = np.asarray(event_codes)
+    pool = np.ones(len(max_ptp_ocular), dtype=bool)
+    if wrong_ans is not None:
+        if selection is None:
+            selection = np.arange(len(pool))
+        pool[np.isin(selection, wrong_ans)] = False
+    n_total = len(max_ptp_ocular)
+    df = pd.DataFrame({"Próg_uV": thresholds * 1e6})
+    kept_total = np.zeros(len(thresholds), dtype=int)
+    kept = {}
+    for cond, code in event_dict.items():
+        sel = np.sort(max_ptp_ocular[pool & (codes == code)])
+        kept[cond] = np.searchsorted(sel, thresholds, side="right")
+        kept_total += kept[cond]
+        df[f"{cond}_n"] = kept[cond]
+        df[f"{cond}_%"] = 100.0 * kept[cond] / max(int(np.sum(codes == code)), 1)
+    df.insert(1, "Odrzucone", n_total - kept_total)
+    df.insert(2, "Zaakceptowane", kept_total)
+    df.insert(3, "Retencja_%", 100.0 * kept_total / max(n_total, 1))
+    counts = np.column_stack([kept[c] for c in event_dict]) if event_dict else np.zeros((len(thresholds), 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["Balans"] = counts.min(axis=1) / counts.max(axis=1)
+        n_valid = sum(kept[c] for c in event_dict if c.endswith("_valid"))
+        n_invalid = sum(kept[c] for c in event_dict if c.endswith("_invalid"))
+        df["Valid_Invalid"] = np.asarray(n_valid, dtype=float) / n_invalid
+    return df
+
+
+def cohort_threshold_sweep(reports, thresholds):
+    """
+    ocular_threshold_sweep dla wielu badanych: reports = {badany: raport z
+    run_artifact_rejection}. Zwraca długi DataFrame z kolumną Badany.
+    """
+    frames = []
+    for subject, rep in reports.items():
+        df = ocular_threshold_sweep(rep["max_ptp_ocular"], thresholds, rep["event_codes"],
+                                    rep["event_id"], wrong_ans=rep["wrong_ans"], selection=rep["selection"])
+        df.insert(0, "Badany", subject)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _wrong_ans_positions(epochs_temp, wrong_ans):
+    """Pozycje w epochs_temp epok o pierwotnych indeksach zdarzeń wrong_ans (brakujące są pomijane)."""
+    return np.flatnonzero(np.isin(epochs_temp.selection, wrong_ans))
 
 
 def drop_bad_epochs(epochs_temp, ocular_bad_idx, wrong_ans=None, verbose=True):
-    """Łączy indeksy artefaktów ocznych i błędnych odpowiedzi, usuwa epoki. Zwraca epochs (kopia)."""
+    """
+    Łączy artefakty oczne (pozycje w epochs_temp) i błędne odpowiedzi (pierwotne indeksy
+    zdarzeń, jak WRONG_ANS — mapowane przez epochs_temp.selection), usuwa epoki. Zwraca epochs (kopia).
+    """
     if wrong_ans is None:
         wrong_ans = WRONG_ANS
-    all_bad = sorted(set(ocular_bad_idx) | set(wrong_ans))
-    print(f"\nOdrzucanie: {len(ocular_bad_idx)} artefakty oczne + {len(wrong_ans)} błędne odpowiedzi = {len(all_bad)} epok łącznie")
+    wrong_pos = _wrong_ans_positions(epochs_temp, wrong_ans)
+    all_bad = sorted(set(int(i) for i in ocular_bad_idx) | set(int(i) for i in wrong_pos))
+    if verbose:
+        print(f"\nOdrzucanie: {len(ocular_bad_idx)} artefakty oczne + {len(wrong_pos)} błędne odpowiedzi = {len(all_bad)} epok łącznie")
     epochs = epochs_temp.copy()
     if len(all_bad) > 0:
-        epochs = epochs.drop(all_bad, reason="REJECT")
+        epochs = epochs.drop(all_bad, reason="REJECT", verbose=None if verbose else False)
     if verbose:
         n_total = len(epochs_temp.events)
         n_keep = len(epochs.events)
@@ -127,28 +436,127 @@ def drop_bad_epochs(epochs_temp, ocular_bad_idx, wrong_ans=None, verbose=True):
     return epochs
 
 
-def run_artifact_rejection(raw, events, event_dict, wrong_ans=None, plot_rejected=True, show_drop_log=True):
+def rejection_report(epochs_temp, epochs_clean, ptp_data, bad_idx, threshold, max_ptp_ocular, idx_ocular, wrong_ans):
+    """
+    Raport odrzucania (dict, bez rysowania): progi, PtP na epokę, indeksy i przyczyny
+    odrzucenia oraz retencja w każdym warunku.
+    Numeracja: "bad_idx", "reasons" i "wrong_ans" — pierwotne indeksy zdarzeń (epochs.selection,
+    jak WRONG_ANS i kolumna Próba w single_trial_peaks); "ocular_bad_idx" — pozycje w epochs_temp,
+    tj. w tablicach "ptp" i "max_ptp_ocular". "selection" przelicza jedne na drugie.
+    """
+    selection = np.asarray(epochs_temp.selection)
+    ocular = set(int(selection[i]) for i in bad_idx)
+    wrong = set(int(selection[i]) for i in _wrong_ans_positions(epochs_temp, wrong_ans))
+    reasons = {}
+    for ix in sorted(ocular | wrong):
+        reasons[ix] = [r for r, bad in (("OCULAR", ix in ocular), ("WRONG_ANS", ix in wrong)) if bad]
+    codes_temp = epochs_temp.events[:, 2]
+    codes_clean = epochs_clean.events[:, 2]
+    retention = {}
+    for cond, code in epochs_temp.event_id.items():
+        n_total = int(np.sum(codes_temp == code))
+        n_kept = int(np.sum(codes_clean == code))
+        retention[cond] = {"total": n_total, "kept": n_kept, "percent": 100.0 * n_kept / n_total if n_total else np.nan}
+    return {
+        "threshold": float(threshold),
+        "threshold_limits": OCULAR_THRESHOLD_LIMITS,
+        "window": (TMIN_ARTEFAKT, TMAX_ARTEFAKT),
+        "ch_names": list(epochs_temp.ch_names),
+        "ocular_channels": [epochs_temp.ch_names[i] for i in idx_ocular],
+        "ptp": ptp_data,
+        "max_ptp_ocular": max_ptp_ocular,
+        "ocular_bad_idx": np.asarray(bad_idx),
+        "wrong_ans": sorted(wrong),
+        "bad_idx": np.array(sorted(reasons), dtype=int),
+        "reasons": reasons,
+        "n_total": len(epochs_temp.events),
+        "n_kept": len(epochs_clean.events),
+        "retention": retention,
+        "event_codes": codes_temp,
+        "event_id": dict(epochs_temp.event_id),
+        "selection": selection,
+    }
+
+
+def plot_rejection_report(report, epochs_temp=None, show=True):
+    """
+    Wykresy z raportu run_artifact_rejection, rysowane dopiero na żądanie:
+    histogram PtP, histogram oczny oraz (jeśli podano epochs_temp) strony odrzuconych epok.
+    Zwraca listę wszystkich figur.
+    """
+    figs = [plot_ptp_hist(report["ptp"])]
+    bad_idx = report["ocular_bad_idx"]
+    if epochs_temp is not None and len(bad_idx) > 0:
+        idx_ocular = [epochs_temp.ch_names.index(ch) for ch in report["ocular_channels"]]
+        figs.extend(plot_rejected_epochs(epochs_temp, bad_idx, report["threshold"], epochs_data_view(epochs_temp),
+                                         epochs_temp.times, report["max_ptp_ocular"], idx_ocular, show=False))
+    else:
+        figs.append(plot_ocular_hist(report["max_ptp_ocular"], bad_idx, report["threshold"]))
+    if show:
+        plt.show()
+    return figs
+
+
+def run_artifact_rejection(raw, events, event_dict, wrong_ans=None, plot_rejected=True, show_drop_log=True,
+                           headless=False, detectors=None, detector_params=None, epochs=None):
     """
     Pełny pipeline: epochs_temp -> ptp stats -> ocular reject -> drop (ocular + wrong_ans) -> epochs_clean.
-    Zwraca (epochs_clean, epochs_temp).
+    Zwraca (epochs_clean, epochs_temp, report) — report jak w rejection_report (progi, PtP,
+    indeksy i przyczyny odrzucenia, retencja), niezależnie od headless.
+    wrong_ans: pierwotne indeksy zdarzeń (jak WRONG_ANS), także gdy MNE pominął część zdarzeń.
+    epochs: gotowe epoki -0.2–0.8 s (np. epochs_from_stream) użyte jako epochs_temp zamiast
+    wycinania z raw — wtedy raw, events i event_dict są ignorowane (mogą być None).
+    detectors: dodatkowe detektory z ARTIFACT_DETECTORS (lista nazw, "all" = wszystkie),
+    liczone na epochs_temp; ich nazwy trafiają do drop_log.
+    headless=True: bez wykresów i wydruków (plot_rejected/show_drop_log ignorowane) —
+    wykresy później z plot_rejection_report(report).
     """
     if wrong_ans is None:
         wrong_ans = WRONG_ANS
-    epochs_temp = mne.Epochs(
-        raw, events, event_id=event_dict,
-        tmin=-0.2, tmax=0.8, baseline=(-0.1, 0),
-        preload=True, reject=None, picks="eeg", verbose=False,
+    verbose = not headless
+    if epochs is None:
+        epochs_temp = mne.Epochs(
+            raw, events, event_id=event_dict,
+            tmin=-0.2, tmax=0.8, baseline=(-0.1, 0),
+            preload=True, reject=None, picks="eeg", verbose=False,
+        )
+    else:
+        epochs_temp = epochs
+    data = epochs_data_view(epochs_temp)
+    ptp_data = ptp_stats(epochs_temp, show_hist=verbose, verbose=verbose, data=data)
+    bad_idx, threshold, data_full, times, mask_t, max_ptp_ocular, idx_ocular = get_ocular_bad_epochs(
+        epochs_temp, verbose=verbose, data=data,
     )
-    ptp_stats(epochs_temp, show_hist=True)
-    bad_idx, threshold, data_full, times, mask_t, max_ptp_ocular, idx_ocular = get_ocular_bad_epochs(epochs_temp, verbose=True)
-    if plot_rejected and len(bad_idx) > 0:
+    if verbose and plot_rejected and len(bad_idx) > 0:
         plot_rejected_epochs(epochs_temp, bad_idx, threshold, data_full, times, max_ptp_ocular, idx_ocular)
-    epochs_clean = drop_bad_epochs(epochs_temp, bad_idx, wrong_ans=wrong_ans, verbose=True)
+    epochs_clean = drop_bad_epochs(epochs_temp, bad_idx, wrong_ans=wrong_ans, verbose=verbose)
+    det_mask = det_names = None
+    if detectors is not None:
+        det_mask, det_names = detect_artifacts(
+            data, epochs_temp.info["sfreq"], detectors=None if detectors == "all" else detectors,
+            params=detector_params,
+        )
+        drop_detected(epochs_clean, det_mask, det_names, selection=epochs_temp.selection, verbose=verbose)
+        if verbose:
+            hits = det_mask.any(axis=2).sum(axis=0)
+            print("\nDetektory artefaktów (epoki z wykryciem):")
+            for name, n in zip(det_names, hits):
+                print(f"  {name:10s}: {n:4d}")
+    report = rejection_report(epochs_temp, epochs_clean, ptp_data, bad_idx, threshold,
+                              max_ptp_ocular, idx_ocular, wrong_ans)
+    if det_mask is not None:
+        report["detectors"] = det_names
+        report["detector_mask"] = det_mask
+        for ix, why in artifact_reasons(det_mask, det_names).items():
+            report["reasons"].setdefault(int(epochs_temp.selection[ix]), []).extend(why)
+        report["bad_idx"] = np.array(sorted(report["reasons"]), dtype=int)
+    if headless:
+        return epochs_clean, epochs_temp, report
     if show_drop_log:
         epochs_clean.plot_drop_log()
         plt.show()
     drop_log_stats(epochs_clean)
-    return epochs_clean, epochs_temp
+    return epochs_clean, epochs_temp, report
 
 
 def drop_log_stats(epochs):
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Równoległe przetwarzanie wielu badanych (pipeline ERP) z linii poleceń.
+
+    python -m src.erp.batch data/ -o results/batch -j 4
+    python -m src.erp.batch manifest.csv -j 8
+
+Manifest CSV: kolumny subject, path i opcjonalnie wrong_ans (indeksy oddzielone spacjami).
+"""
+
+import argparse
+import contextlib
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from .constants import MONITOR_DELAY_SEC, SMR_CACHE_DIR, ERP_FIGURE_PROFILES
+
+# Jeden wątek BLAS na proces — równoległość daje pula procesów
+_THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+@contextlib.contextmanager
+def _worker_env():
+    """
+    Zmienne _THREAD_ENV = "1" (jeśli nie są ustawione) tylko na czas pracy puli: procesy "spawn"
+    dziedziczą je przy starcie, zanim zaimportują numpy. Potem środowisko wywołującego jest przywracane.
+    """
+    added = [var for var in _THREAD_ENV if var not in os.environ]
+    for var in added:
+        os.environ[var] = "1"
+    try:
+        yield
+    finally:
+        for var in added:
+            os.environ.pop(var, None)
+
+
+def read_manifest(source):
+    """
+    Lista badanych [{"subject", "path", "wrong_ans"}] z katalogu (*.smr) lub manifestu CSV.
+    Dla katalogu wrong_ans jest puste — WRONG_ANS dotyczy jednego badanego.
+    """
+    if os.path.isdir(source):
+        names = sorted(f for f in os.listdir(source) if f.lower().endswith(".smr"))
+        return [
+            {"subject": os.path.splitext(f)[0], "path": os.path.join(source, f), "wrong_ans": []}
+            for f in names
+        ]
+    df = pd.read_csv(source, dtype=str).fillna("")
+    base = os.path.dirname(os.path.abspath(source))
+    subjects = []
+    for _, row in df.iterrows():
+        path = row["path"] if os.path.isabs(row["path"]) else os.path.join(base, row["path"])
+        wrong = row.get("wrong_ans", "")
+        subjects.append({
+            "subject": row.get("subject") or os.path.splitext(os.path.basename(path))[0],
+            "path": path,
+            "wrong_ans": [int(x) for x in wrong.split()],
+        })
+    return subjects
+
+
+def run_subject(subject, path, output_dir, wrong_ans=(), ch_names_to_drop=("F8",),
+                use_cache=True, cache_dir=SMR_CACHE_DIR, qa=False):
+    """
+    Pipeline ERP dla jednego pliku .smr: epoki (w V, bez usuniętych kanałów) wycinane strumieniowo
+    z cache (mmap) -> artefakty -> evoked -> piki; ciągły sygnał nie jest kopiowany. Zapisuje do output_dir/<subject>/ evoked (FIF),
+    akumulator do średniej grupowej (npz), tabele pików (CSV) i log; qa=True dodaje strony odrzuconych epok w qa/.
+    Zwraca (wiersz podsumowania, DataFrame pików z weryfikacją).
+    """
+    import matplotlib.pyplot as plt
+    import mne
+
+    from .cache import open_smr_cache
+    from .io_spike2 import load_smr_block
+    from .raw_mne import block_to_raw
+    from .events import build_events
+    from .epochs_stream import epochs_from_stream
+    from .artifacts import run_artifact_rejection, epochs_data_view, export_rejected_epochs
+    from .erp import compute_evokeds
+    from .grand_average import EvokedAccumulator
+    from .peaks import find_peaks_simple, find_peaks_validated, save_peak_tables
+
+    subj_dir = os.path.join(output_dir, subject)
+    os.makedirs(subj_dir, exist_ok=True)
+    summary = {"Badany": subject, "Plik": path, "Status": "ok", "Epoki": 0, "Zaakceptowane": 0, "Próg_uV": np.nan, "Czas_s": 0.0, "Błąd": ""}
+    df_validated = None
+    t0 = time.perf_counter()
+    with open(os.path.join(subj_dir, "log.txt"), "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            if use_cache:
+                data, events, meta = open_smr_cache(path, cache_dir=cache_dir)
+                sfreq, ch_names, first_samp = meta["sfreq"], meta["ch_names"], meta["first_samp"]
+                event_dict = dict(meta["event_dict"])
+            else:
+                block = load_smr_block(path, lazy=True)
+                raw, data, sfreq = block_to_raw(block, to_volts=True)
+                ch_names, first_samp = raw.ch_names, raw.first_samp
+                events, event_dict = build_events(block.segments[0], sfreq, delay_sec=MONITOR_DELAY_SEC)
+                del raw, block
+            picks = [i for i, ch in enumerate(ch_names) if ch not in ch_names_to_drop]
+            epochs = epochs_from_stream(
+                data, events, sfreq, event_dict, ch_names, first_samp=first_samp, picks=picks, verbose=False,
+            )
+            del data
+            epochs_clean, epochs_temp, report = run_artifact_rejection(
+                None, events, event_dict, wrong_ans=list(wrong_ans), headless=True, epochs=epochs,
+            )
+            if qa:
+                export_rejected_epochs(
+                    epochs_temp.ch_names, report["ocular_bad_idx"], report["threshold"],
+                    epochs_data_view(epochs_temp), epochs_temp.times, report["max_ptp_ocular"],
+                    [epochs_temp.ch_names.index(ch) for ch in report["ocular_channels"]],
+                    os.path.join(subj_dir, "qa"),
+                )
+            evoked_dict = compute_evokeds(epochs_clean)
+            for name, evoked in evoked_dict.items():
+                evoked.comment = name
+            mne.write_evokeds(os.path.join(subj_dir, f"{subject}-ave.fif"), list(evoked_dict.values()), overwrite=True)
+            EvokedAccumulator().add_evokeds(evoked_dict).save(os.path.join(subj_dir, f"{subject}-acc.npz"))
+            df_simple = find_peaks_simple(evoked_dict)
+            df_validated = find_peaks_validated(evoked_dict)
+            save_peak_tables(df_simple, df_validated, output_dir=subj_dir)
+            summary["Epoki"] = report["n_total"]
+            summary["Zaakceptowane"] = report["n_kept"]
+            summary["Próg_uV"] = round(report["threshold"] * 1e6, 1)
+        except Exception as exc:
+            traceback.print_exc()
+            summary["Status"] = "błąd"
+            summary["Błąd"] = f"{type(exc).__name__}: {exc}"
+        finally:
+            plt.close("all")
+    summary["Czas_s"] = round(time.perf_counter() - t0, 2)
+    if df_validated is not None:
+        df_validated.insert(0, "Badany", subject)
+    return summary, df_validated
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+_FIGURE_TEMPLATE = None  # szablon figury ERP, jeden na proces roboczy
+
+
+def _export_subject_figures(evoked_path, output_dir, profile):
+    global _FIGURE_TEMPLATE
+    import mne
+
+    from .erp import ErpFigureTemplate, export_erp_figures
+
+    evoked_dict = {ev.comment: ev for ev in mne.read_evokeds(evoked_path, verbose=False)}
+    times_ms = evoked_dict["left_valid"].times * 1000
+    if _FIGURE_TEMPLATE is None or not np.array_equal(_FIGURE_TEMPLATE.times_ms, times_ms):
+        _FIGURE_TEMPLATE = ErpFigureTemplate(times_ms)
+    return export_erp_figures(evoked_dict, output_dir=output_dir, profile=profile, template=_FIGURE_TEMPLATE)
+
+
+def export_cohort_figures(subjects, output_dir="results/batch", profile="preview", n_jobs=None, verbose=True):
+    """
+    Eksport paneli ERP dla badanych przetworzonych przez run_batch (<subject>/<subject>-ave.fif)
+    w puli procesów; każdy proces buduje szablon figury raz i podmienia tylko dane.
+    profile: "preview" (100 dpi), "publication" (300 dpi) lub "vector" (PDF). Zwraca listę ścieżek.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    paths = []
+    ctx = multiprocessing.get_context("spawn")
+    with _worker_env(), ProcessPoolExecutor(max_workers=n_jobs, mp_context=ctx, initializer=_init_worker) as pool:
+        futures = {}
+        for subject in subjects:
+            subj_dir = os.path.join(output_dir, subject)
+            evoked_path = os.path.join(subj_dir, f"{subject}-ave.fif")
+            if os.path.exists(evoked_path):
+                futures[pool.submit(_export_subject_figures, evoked_path, subj_dir, profile)] = subject
+        for fut in as_completed(futures):
+            try:
+                paths.extend(fut.result())
+            except Exception as exc:
+                if verbose:
+                    print(f"  {futures[fut]}: błąd wykresów {type(exc).__name__}: {exc}")
+    if verbose:
+        print(f"✓ Zapisano {len(paths)} wykresów ERP ({profile})")
+    return paths
+
+
+def run_batch(subjects, output_dir="results/batch", n_jobs=None, use_cache=True, cache_dir=SMR_CACHE_DIR,
+              ch_names_to_drop=("F8",), qa=False, figures=None, verbose=True):
+    """
+    Uruchamia run_subject dla każdego badanego w puli n_jobs procesów (domyślnie liczba rdzeni).
+    Błąd jednego badanego (także odczytu jego akumulatora) nie przerywa pozostałych.
+    cache_dir: wspólny katalog cache .smr dla wszystkich procesów. Zapisuje batch_summary.csv,
+    ERP_peaks_validated_all.csv oraz średnią grupową z SE między badanymi
+    (grand_average-ave.fif, grand_average_se-ave.fif) w output_dir. figures: profil eksportu
+    paneli ERP dla każdego badanego (export_cohort_figures) lub None. Zwraca DataFrame podsumowania.
+    """
+    import mne
+
+    from .grand_average import EvokedAccumulator
+
+    os.makedirs(output_dir, exist_ok=True)
+    cache_dir = os.path.abspath(cache_dir)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    rows, peaks = [], []
+    grand = EvokedAccumulator()
+    ctx = multiprocessing.get_context("spawn")
+    with _worker_env(), ProcessPoolExecutor(max_workers=n_jobs, mp_context=ctx, initializer=_init_worker) as pool:
+        futures = {
+            pool.submit(
+                run_subject, s["subject"], s["path"], output_dir, wrong_ans=s.get("wrong_ans", ()),
+                ch_names_to_drop=ch_names_to_drop, use_cache=use_cache, cache_dir=cache_dir, qa=qa,
+            ): s["subject"]
+            for s in subjects
+        }
+        for fut in as_completed(futures):
+            try:
+                summary, df_validated = fut.result()
+            except Exception as exc:  # np. awaria procesu roboczego
+                summary = {"Badany": futures[fut], "Status": "błąd", "Błąd": f"{type(exc).__name__}: {exc}"}
+                df_validated = None
+            if summary["Status"] == "ok":
+                acc_path = os.path.join(output_dir, summary["Badany"], f"{summary['Badany']}-acc.npz")
+                try:
+                    grand.merge(EvokedAccumulator.load(acc_path))
+                except Exception as exc:  # np. uszkodzony lub brakujący -acc.npz
+                    summary["Status"] = "błąd"
+                    summary["Błąd"] = f"{type(exc).__name__}: {exc}"
+                    df_validated = None
+            rows.append(summary)
+            if df_validated is not None:
+                peaks.append(df_validated)
+            if verbose:
+                print(f"  {summary['Badany']}: {summary['Status']} {summary.get('Błąd', '')}".rstrip())
+    df_summary = pd.DataFrame(rows).sort_values("Badany").reset_index(drop=True)
+    df_summary.to_csv(os.path.join(output_dir, "batch_summary.csv"), index=False, encoding="utf-8-sig")
+    if peaks:
+        df_peaks = pd.concat(peaks, ignore_index=True).sort_values("Badany", kind="stable")
+        df_peaks.to_csv(os.path.join(output_dir, "ERP_peaks_validated_all.csv"), index=False, encoding="utf-8-sig")
+    if grand.n:
+        mne.write_evokeds(os.path.join(output_dir, "grand_average-ave.fif"), list(grand.to_evokeds().values()), overwrite=True)
+        mne.write_evokeds(os.path.join(output_dir, "grand_average_se-ave.fif"), list(grand.se_evokeds().values()), overwrite=True)
+    if verbose:
+        n_ok = int((df_summary["Status"] == "ok").sum())
+        print(f"\n✓ Przetworzono {n_ok}/{len(df_summary)} badanych -> {output_dir}")
+    if figures:
+        ok = df_summary.loc[df_summary["Status"] == "ok", "Badany"].tolist()
+        export_cohort_figures(ok, output_dir=output_dir, profile=figures, n_jobs=n_jobs, verbose=verbose)
+    return df_summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline ERP (Posner) dla wielu plików .smr.")
+    parser.add_argument("input", help="katalog z plikami .smr lub manifest CSV (subject,path[,wrong_ans])")
+    parser.add_argument("-o", "--output-dir", default="results/batch")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="liczba procesów (domyślnie: liczba rdzeni)")
+    parser.add_argument("--no-cache", action="store_true", help="nie używaj cache .smr")
+    parser.add_argument("--cache-dir", default=SMR_CACHE_DIR, help=f"katalog cache .smr (domyślnie {SMR_CACHE_DIR})")
+    parser.add_argument("--drop", nargs="*", default=["F8"], help="kanały do usunięcia (domyślnie F8)")
+    parser.add_argument("--qa", action="store_true", help="zapisz strony odrzuconych epok (qa/)")
+    parser.add_argument("--figures", choices=sorted(ERP_FIGURE_PROFILES), default=None,
+                        help="eksport paneli ERP każdego badanego (preview/publication/vector)")
+    args = parser.parse_args(argv)
+    subjects = read_manifest(args.input)
+    if not subjects:
+        print(f"Brak plików .smr w {args.input}")
+        return 1
+    df_summary = run_batch(
+        subjects, output_dir=args.output_dir, n_jobs=args.jobs,
+        use_cache=not args.no_cache, cache_dir=args.cache_dir, ch_names_to_drop=tuple(args.drop), qa=args.qa,
+        figures=args.figures,
+    )
+    return 0 if (df_summary["Status"] == "ok").all() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Bootstrapowe pasma ufności dla fal ERP (warunki i różnice), wektorowo po próbach."""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import mne
+
+from .constants import BOOTSTRAP_N, BOOTSTRAP_CI, BOOTSTRAP_MAX_MEMORY_MB
+from .selection import epochs_buffer
+from .erp import condition_groups
+
+# Różnice poprawna − niepoprawna; nazwy z prefiksem strony pasują do lateralized_waves
+BOOTSTRAP_CONTRASTS = {
+    "left_diff": ("left_valid", "left_invalid"),
+    "right_diff": ("right_valid", "right_invalid"),
+    "diff": ("valid", "invalid"),
+}
+
+_WORKER = {}
+
+
+def bootstrap_weights(n_trials, n_boot=BOOTSTRAP_N, rng=None):
+    """
+    Macierz wag (n_boot × n_trials): liczności losowania ze zwracaniem / n_trials.
+    Średnie bootstrapowe to wtedy weights @ dane — jedno mnożenie zamiast n_boot × average().
+    """
+    rng = np.random.default_rng(rng)
+    counts = rng.multinomial(n_trials, np.full(n_trials, 1.0 / n_trials), size=n_boot)
+    return counts / n_trials
+
+
+def _block_percentiles(flat, weights, index, cols, contrasts, q):
+    """
+    Percentyle q dla warunków i różnic na wycinku cech cols (kanały × czas spłaszczone).
+    Próby grupy są czytane ze wspólnego flat (próby × cechy) tylko dla tego wycinka.
+    """
+    means = {g: w @ np.asarray(flat[index[g], cols], dtype=np.float64) for g, w in weights.items()}
+    out = {g: np.percentile(m, q, axis=0) for g, m in means.items()}
+    for name, (a, b) in contrasts.items():
+        out[name] = np.percentile(means[a] - means[b], q, axis=0)
+    return out
+
+
+def _init_worker(shm_name, shape, dtype, weights, index, contrasts, q):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    flat = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _WORKER.update(shm=shm, flat=flat, weights=weights, index=index, contrasts=contrasts, q=q)
+
+
+def _worker_block(cols):
+    w = _WORKER
+    return _block_percentiles(w["flat"], w["weights"], w["index"], cols, w["contrasts"], w["q"])
+
+
+def bootstrap_bands(epochs, conditions=None, pooled=None, contrasts=None, n_boot=BOOTSTRAP_N,
+                    ci=BOOTSTRAP_CI, seed=None, max_memory_mb=BOOTSTRAP_MAX_MEMORY_MB, n_jobs=1):
+    """
+    Percentylowe pasma ufności ci% dla średnich warunków i różnic (contrasts: nazwa -> (a, b)).
+    Próby losowane są raz (macierz wag na warunek, ziarno seed), a średnie bootstrapowe liczone
+    jako wagi @ dane w blokach kanały × czas: blok prób grupy czytany jest z danych epok bez
+    kopii całości, a blok prób i średnie bootstrapowe mieszczą się w max_memory_mb (na proces).
+    Bloki mogą iść do n_jobs procesów, które czytają zachowane próby z jednej pamięci
+    współdzielonej — wynik nie zależy od n_jobs. epochs: mne.Epochs lub MaskedEpochs.
+    Zwraca (lo, hi): dict nazwa -> Evoked (V), np. lo["left_diff"], hi["valid"].
+    """
+    conditions, groups = condition_groups(epochs.event_id, conditions, pooled)
+    if contrasts is None:
+        contrasts = {k: v for k, v in BOOTSTRAP_CONTRASTS.items() if all(g in groups for g in v)}
+    data, keep, base = epochs_buffer(epochs)
+    codes = base.events[:, 2]
+    n_feat = int(np.prod(data.shape[1:]))
+    flat = data.reshape(len(data), n_feat)
+
+    rng = np.random.default_rng(seed)
+    weights, index = {}, {}
+    for name, members in groups.items():
+        idx = np.flatnonzero(keep & np.isin(codes, [epochs.event_id[c] for c in members]))
+        if len(idx) == 0:
+            raise ValueError(f"Brak prób w warunku {name}")
+        weights[name] = bootstrap_weights(len(idx), n_boot, rng)
+        index[name] = idx
+    nave = {name: len(idx) for name, idx in index.items()}
+
+    alpha = (100 - ci) / 2
+    q = [alpha, 100 - alpha]
+    # Jednocześnie w pamięci na kolumnę bloku: próby największej grupy, średnie bootstrapowe
+    # wszystkich warunków i jedna różnica
+    per_col = (max(nave.values()) + n_boot * (len(weights) + 1)) * 8
+    block = max(1, int(max_memory_mb * 1024**2 // per_col))
+    blocks = [slice(s, min(s + block, n_feat)) for s in range(0, n_feat, block)]
+    if n_jobs > 1 and len(blocks) > 1:
+        # zachowane próby raz w pamięci współdzielonej, indeksy grup przeliczone na jej wiersze
+        used = np.unique(np.concatenate(list(index.values())))
+        shared_index = {name: np.searchsorted(used, idx) for name, idx in index.items()}
+        shm = shared_memory.SharedMemory(create=True, size=max(len(used) * n_feat * 8, 1))
+        try:
+            shared = np.ndarray((len(used), n_feat), dtype=np.float64, buffer=shm.buf)
+            for s in range(0, len(used), 256):
+                shared[s:s + 256] = flat[used[s:s + 256]]
+            ctx = multiprocessing.get_context("spawn")
+            initargs = (shm.name, shared.shape, shared.dtype.str, weights, shared_index, contrasts, q)
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(blocks)), mp_context=ctx,
+                                     initializer=_init_worker, initargs=initargs) as pool:
+                parts = list(pool.map(_worker_block, blocks))
+            del shared
+        finally:
+            shm.close()
+            shm.unlink()
+    else:
+        parts = [_block_percentiles(flat, weights, index, cols, contrasts, q) for cols in blocks]
+
+    lo, hi = {}, {}
+    for name in list(groups) + list(contrasts):
+        band = np.concatenate([p[name] for p in parts], axis=1).reshape((2,) + data.shape[1:])
+        n = nave[name] if name in nave else min(nave[g] for g in contrasts[name])
+        kwargs = dict(info=base.info, tmin=base.tmin, nave=n, verbose=False)
+        lo[name] = mne.EvokedArray(band[0], comment=f"{name} {q[0]:g}%", **kwargs)
+        hi[name] = mne.EvokedArray(band[1], comment=f"{name} {q[1]:g}%", **kwargs)
+    return lo, hi
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""Cache zdekodowanych nagrań .smr na dysku (sygnał .npy + zdarzenia), z ograniczeniem rozmiaru."""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import mne
+
+from .constants import (
+    CH_NAMES_10_20,
+    EVENT_MAPPING,
+    EVENT_DICT,
+    MONITOR_DELAY_SEC,
+    SMR_CACHE_DIR,
+    SMR_CACHE_MAX_BYTES,
+)
+from .io_spike2 import load_smr_block, event_time_window
+from .raw_mne import block_to_raw
+from .events import build_events
+
+# Zmiana formatu zapisu lub przetwarzania -> nowa wersja unieważnia stare wpisy
+CACHE_VERSION = 3
+
+
+def _digest(payload):
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _source_fingerprint(filename):
+    """Odcisk pliku (ścieżka + rozmiar + mtime) i stałych wpływających na wynik."""
+    st = os.stat(filename)
+    return _digest({
+        "version": CACHE_VERSION,
+        "path": os.path.abspath(filename),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "ch_names": list(CH_NAMES_10_20),
+        "event_mapping": EVENT_MAPPING,
+        "monitor_delay_sec": MONITOR_DELAY_SEC,
+    })
+
+
+def _cache_key(fingerprint, channels=None, padding=None):
+    """Klucz wpisu: odcisk źródła + wybór kanałów i okna."""
+    return _digest({
+        "fingerprint": fingerprint,
+        "channels": None if channels is None else list(channels),
+        "padding": None if padding is None else list(padding),
+    })
+
+
+def _entry_size(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def _read_meta(path):
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _cache_entries(cache_dir):
+    """Kompletne wpisy cache (z meta.json); katalogi tymczasowe zapisu innych procesów (".klucz.*") są pomijane."""
+    if not os.path.isdir(cache_dir):
+        return []
+    return [
+        os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+        if not name.startswith(".") and os.path.isfile(os.path.join(cache_dir, name, "meta.json"))
+    ]
+
+
+def evict_smr_cache(cache_dir=SMR_CACHE_DIR, max_bytes=SMR_CACHE_MAX_BYTES, keep=(), verbose=True):
+    """
+    Usuwa najdawniej używane wpisy (LRU wg mtime meta.json), aż rozmiar cache <= max_bytes.
+    Wpis usunięty w międzyczasie przez inny proces jest traktowany jako już usunięty.
+    """
+    entries = []
+    for p in _cache_entries(cache_dir):
+        try:
+            entries.append((os.path.getmtime(os.path.join(p, "meta.json")), _entry_size(p), p))
+        except FileNotFoundError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if os.path.basename(path) in keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        if verbose:
+            print(f"Cache: usunięto {os.path.basename(path)} ({size / 1024**2:.1f} MB)")
+    return total
+
+
+def _drop_stale_entries(cache_dir, source, fingerprint):
+    """Usuwa wpisy tego samego pliku źródłowego z nieaktualnym odciskiem (zmieniony plik lub stałe)."""
+    for path in _cache_entries(cache_dir):
+        try:
+            meta = _read_meta(path)
+        except FileNotFoundError:
+            continue
+        if meta.get("source") == source and meta.get("fingerprint") != fingerprint:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _write_entry(cache_dir, key, data, events, meta):
+    """Zapis atomowy: katalog tymczasowy -> rename (bezpieczne przy współdzielonym cache)."""
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{key}.", dir=cache_dir)
+    np.save(os.path.join(tmp, "data.npy"), data)
+    np.save(os.path.join(tmp, "events.npy"), events)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    try:
+        os.replace(tmp, os.path.join(cache_dir, key))
+    except OSError:
+        # Inny proces zapisał ten sam wpis równolegle
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def open_smr_cache(filename, cache_dir=SMR_CACHE_DIR, max_cache_bytes=SMR_CACHE_MAX_BYTES,
+                   channels=None, padding=None, verbose=True):
+    """
+    Zwraca wpis cache dla pliku .smr, tworząc go przy pierwszym użyciu
+    (load_smr_block + block_to_raw(to_volts=True) + build_events z opóźnieniem monitora).
+    Sygnał jest zapisany w V i mapowany z .npy (mmap, copy-on-write) bez użycia Neo.
+    Wpis unieważnia zmiana pliku (rozmiar/mtime), CH_NAMES_10_20, EVENT_MAPPING lub MONITOR_DELAY_SEC.
+    channels / padding: jak w block_to_raw / event_time_window (None = wszystko).
+    Zwraca (data, events, meta): data (kanały × czas), meta z sfreq, ch_names, first_samp, event_dict.
+    """
+    fingerprint = _source_fingerprint(filename)
+    key = _cache_key(fingerprint, channels=channels, padding=padding)
+    entry = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry, "meta.json")
+    # Przy współdzielonym cache inny proces może usunąć wpis (evict_smr_cache) między zapisem
+    # lub sprawdzeniem a odczytem — wtedy wpis jest tworzony ponownie
+    for _ in range(3):
+        created = not os.path.isfile(meta_path)
+        if created:
+            _create_entry(filename, cache_dir, key, fingerprint, channels, padding, max_cache_bytes, verbose)
+        try:
+            os.utime(meta_path)
+            meta = _read_meta(entry)
+            data = np.load(os.path.join(entry, "data.npy"), mmap_mode="c")
+            events = np.load(os.path.join(entry, "events.npy"))
+        except FileNotFoundError:
+            continue
+        if verbose and not created:
+            print(f"Cache: {filename} -> {entry}")
+        return data, events, meta
+    raise RuntimeError(f"Cache: wpis {entry} jest usuwany szybciej, niż można go odczytać (max_cache_bytes za mały?)")
+
+
+def _create_entry(filename, cache_dir, key, fingerprint, channels, padding, max_cache_bytes, verbose):
+    """Dekoduje plik .smr i zapisuje wpis cache (load_smr_block + block_to_raw + build_events)."""
+    block = load_smr_block(filename, verbose=verbose, lazy=True)
+    seg = block.segments[0]
+    time_slice = event_time_window(seg, padding) if padding is not None else None
+    raw, data, sfreq = block_to_raw(
+        block, channels=channels, time_slice=time_slice, to_volts=True, verbose=verbose,
+    )
+    events, _ = build_events(seg, sfreq, verbose=verbose, delay_sec=MONITOR_DELAY_SEC)
+    meta = {
+        "source": os.path.abspath(filename),
+        "fingerprint": fingerprint,
+        "sfreq": sfreq,
+        "ch_names": raw.ch_names,
+        "first_samp": int(raw.first_samp),
+        "event_dict": EVENT_DICT,
+    }
+    del raw, block
+    _drop_stale_entries(cache_dir, meta["source"], fingerprint)
+    _write_entry(cache_dir, key, data, events, meta)
+    del data
+    if max_cache_bytes is not None:
+        evict_smr_cache(cache_dir, max_cache_bytes, keep=(key,), verbose=verbose)
+    if verbose:
+        print(f"Cache: zapisano {os.path.join(cache_dir, key)}")
+
+
+def load_smr_cached(filename, cache_dir=SMR_CACHE_DIR, max_cache_bytes=SMR_CACHE_MAX_BYTES,
+                    channels=None, padding=None, verbose=True):
+    """
+    Jak load_smr_block + block_to_raw(to_volts=True) + build_events (z opóźnieniem monitora),
+    ale z cache na dysku (open_smr_cache). Raw (w V) korzysta bezpośrednio z mapowanego .npy.
+    Zwraca (raw, events, event_dict).
+    """
+    data, events, meta = open_smr_cache(
+        filename, cache_dir=cache_dir, max_cache_bytes=max_cache_bytes,
+        channels=channels, padding=padding, verbose=verbose,
+    )
+    info = mne.create_info(
+        ch_names=meta["ch_names"],
+        sfreq=meta["sfreq"],
+        ch_types=["eeg"] * len(meta["ch_names"]),
+    )
+    raw = mne.io.RawArray(data, info, first_samp=meta["first_samp"], verbose=False)
+    return raw, events, dict(meta["event_dict"])
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Test permutacyjny klastrów (kanały × czas): poprawna vs niepoprawna i różnice contra − ipsi."""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+from scipy.sparse.csgraph import connected_components
+
+from .constants import ADJACENCY_10_20, CLUSTER_N_PERM, CLUSTER_ALPHA, CLUSTER_MAX_MEMORY_MB
+from .lateralization import lateralized_waves
+from .erp import POOLED_CONDITIONS
+
+_WORKER = {}
+
+
+def channel_adjacency(ch_names, adjacency=None):
+    """Macierz sąsiedztwa kanałów (bool, kanały × kanały) z ADJACENCY_10_20; brakujące kanały są pomijane."""
+    if adjacency is None:
+        adjacency = ADJACENCY_10_20
+    pos = {ch: i for i, ch in enumerate(ch_names)}
+    adj = np.zeros((len(ch_names), len(ch_names)), dtype=bool)
+    for ch, neighbours in adjacency.items():
+        if ch in pos:
+            for nb in neighbours:
+                if nb in pos:
+                    adj[pos[ch], pos[nb]] = adj[pos[nb], pos[ch]] = True
+    return adj
+
+
+def _graph_edges(ch_adj, n_times):
+    """Krawędzie grafu kanały × czas (węzeł = kanał * n_times + próbka): sąsiednie kanały i sąsiednie próbki."""
+    ci, cj = np.nonzero(np.triu(ch_adj, 1))
+    t = np.arange(n_times)
+    spatial_i = (ci[:, None] * n_times + t).ravel()
+    spatial_j = (cj[:, None] * n_times + t).ravel()
+    ch = np.arange(ch_adj.shape[0])[:, None] * n_times
+    temporal_i = (ch + t[:-1]).ravel()
+    return np.concatenate([spatial_i, temporal_i]), np.concatenate([spatial_j, temporal_i + 1])
+
+
+def _clusters(stat, threshold, edges):
+    """
+    Etykiety klastrów (spójne składowe nadprogowych węzłów tego samego znaku) i ich masy (suma statystyki).
+    Zwraca (labels, masses); labels = -1 dla węzłów podprogowych.
+    """
+    ei, ej = edges
+    sign = np.where(stat > threshold, 1, np.where(stat < -threshold, -1, 0))
+    keep = (sign[ei] != 0) & (sign[ei] == sign[ej])
+    n = len(stat)
+    graph = sparse.coo_matrix((np.ones(int(keep.sum()), dtype=np.int8), (ei[keep], ej[keep])), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    labels = np.where(sign != 0, labels, -1)
+    supra = labels >= 0
+    _, labels[supra] = np.unique(labels[supra], return_inverse=True)
+    masses = np.bincount(labels[supra], weights=stat[supra]) if supra.any() else np.zeros(0)
+    return labels, masses
+
+
+def _max_mass(stat, threshold, edges):
+    _, masses = _clusters(stat, threshold, edges)
+    return np.abs(masses).max() if len(masses) else 0.0
+
+
+def _t_paired(sums, sumsq, n):
+    """Statystyka t jednej próby z sum (partia × cechy) i sum kwadratów (cechy)."""
+    mean = sums / n
+    var = (sumsq - n * mean * mean) / (n - 1)
+    return mean / np.sqrt(np.maximum(var, 1e-300) / n)
+
+
+def _t_independent(sum_a, sumsq_a, n_a, sum_b, sumsq_b, n_b):
+    """Statystyka t dla dwóch niezależnych prób (wariancja łączona) z sum i sum kwadratów."""
+    mean_a, mean_b = sum_a / n_a, sum_b / n_b
+    ss = (sumsq_a - n_a * mean_a ** 2) + (sumsq_b - n_b * mean_b ** 2)
+    var = ss / (n_a + n_b - 2)
+    return (mean_a - mean_b) / np.sqrt(np.maximum(var, 1e-300) * (1 / n_a + 1 / n_b))
+
+
+def _perm_batch(kind, x, n_perm, seed, threshold, edges, n_a=None):
+    """Maksymalne masy klastrów dla n_perm permutacji (znaki lub etykiety), jedną macierzą na partię."""
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    if kind == "paired":
+        signs = rng.choice(np.array([-1.0, 1.0]), size=(n_perm, n))
+        t = _t_paired(signs @ x, (x * x).sum(axis=0), n)
+    else:
+        order = rng.random((n_perm, n)).argsort(axis=1)
+        member = np.zeros((n_perm, n))
+        np.put_along_axis(member, order[:, :n_a], 1.0, axis=1)
+        x2 = x * x
+        sum_a, sumsq_a = member @ x, member @ x2
+        t = _t_independent(sum_a, sumsq_a, n_a, x.sum(axis=0) - sum_a, x2.sum(axis=0) - sumsq_a, n - n_a)
+    return np.array([_max_mass(row, threshold, edges) for row in t])
+
+
+def _init_worker(kind, x, threshold, edges, n_a):
+    _WORKER.update(kind=kind, x=x, threshold=threshold, edges=edges, n_a=n_a)
+
+
+def _worker_batch(args):
+    n_perm, seed = args
+    w = _WORKER
+    return _perm_batch(w["kind"], w["x"], n_perm, seed, w["threshold"], w["edges"], n_a=w["n_a"])
+
+
+def _permutation_test(kind, x, shape, ch_names, times, threshold, n_perm, alpha, seed,
+                      max_memory_mb, n_jobs, adjacency, n_a=None):
+    n_feat = int(np.prod(shape))
+    n = len(x)
+    df = n - 1 if kind == "paired" else n - 2
+    if threshold is None:
+        threshold = float(stats.t.ppf(1 - alpha / 2, df))
+    edges = _graph_edges(channel_adjacency(ch_names, adjacency), shape[1])
+    if kind == "paired":
+        t_obs = _t_paired(x.sum(axis=0), (x * x).sum(axis=0), n)
+    else:
+        x2 = x * x
+        t_obs = _t_independent(x[:n_a].sum(0), x2[:n_a].sum(0), n_a, x[n_a:].sum(0), x2[n_a:].sum(0), n - n_a)
+    labels, masses = _clusters(t_obs, threshold, edges)
+
+    # partia: macierz permutacji (partia × próby) i statystyki (partia × cechy), ~3 tablice float64
+    batch = max(1, int(max_memory_mb * 1024**2 // ((3 * n_feat + n) * 8)))
+    sizes = [min(batch, n_perm - s) for s in range(0, n_perm, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = list(zip(sizes, seeds))
+    if n_jobs > 1 and len(tasks) > 1:
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks)), mp_context=ctx,
+                                 initializer=_init_worker, initargs=(kind, x, threshold, edges, n_a)) as pool:
+            h0 = np.concatenate(list(pool.map(_worker_batch, tasks)))
+    else:
+        h0 = np.concatenate([_perm_batch(kind, x, k, s, threshold, edges, n_a=n_a) for k, s in tasks])
+
+    clusters = []
+    for k, mass in enumerate(masses):
+        mask = (labels == k).reshape(shape)
+        chans, samples = np.nonzero(mask)
+        clusters.append({
+            "mask": mask, "mass": float(mass), "sign": int(np.sign(mass)),
+            "p": float((np.sum(h0 >= abs(mass)) + 1) / (n_perm + 1)),
+            "channels": [ch_names[c] for c in np.unique(chans)],
+            "tmin": float(times[samples.min()]), "tmax": float(times[samples.max()]),
+        })
+    clusters.sort(key=lambda c: c["p"])
+    return {
+        "t_obs": t_obs.reshape(shape), "threshold": threshold, "clusters": clusters, "h0": h0,
+        "ch_names": list(ch_names), "times": times, "n_perm": n_perm,
+    }
+
+
+def cluster_test_paired(x, ch_names, times, threshold=None, n_perm=CLUSTER_N_PERM, alpha=CLUSTER_ALPHA,
+                        seed=None, max_memory_mb=CLUSTER_MAX_MEMORY_MB, n_jobs=1, adjacency=None):
+    """
+    Test klastrowy jednej próby (np. różnice poprawna − niepoprawna badanych): x (badani × kanały × czas).
+    Permutacje to zmiany znaku badanych — partia jako macierz znaków @ dane (wariancja nie zależy
+    od znaków), partie w budżecie max_memory_mb, opcjonalnie w n_jobs procesach; ziarno seed.
+    Próg: t dla alpha dwustronnie (df = n − 1). Masa klastra = suma t; p z rozkładu maksymalnej masy.
+    Zwraca dict: t_obs, threshold, clusters (mask, mass, sign, p, channels, tmin, tmax), h0.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    shape = x.shape[1:]
+    return _permutation_test("paired", x.reshape(len(x), -1), shape, ch_names, times, threshold, n_perm,
+                             alpha, seed, max_memory_mb, n_jobs, adjacency)
+
+
+def cluster_test_independent(x_a, x_b, ch_names, times, threshold=None, n_perm=CLUSTER_N_PERM,
+                             alpha=CLUSTER_ALPHA, seed=None, max_memory_mb=CLUSTER_MAX_MEMORY_MB,
+                             n_jobs=1, adjacency=None):
+    """
+    Test klastrowy dwóch niezależnych prób (np. próby poprawne vs niepoprawne jednego badanego):
+    x_a, x_b (próby × kanały × czas). Permutacje to przetasowania etykiet — sumy grupy jako
+    macierz przynależności @ dane. Parametry i wynik jak w cluster_test_paired (df = n_a + n_b − 2).
+    """
+    x = np.concatenate([np.asarray(x_a, dtype=np.float64), np.asarray(x_b, dtype=np.float64)])
+    shape = x.shape[1:]
+    return _permutation_test("independent", x.reshape(len(x), -1), shape, ch_names, times, threshold, n_perm,
+                             alpha, seed, max_memory_mb, n_jobs, adjacency, n_a=len(x_a))
+
+
+def cluster_test_evokeds(evoked_dicts, cond_a="valid", cond_b="invalid", **kwargs):
+    """Test klastrowy w kohorcie: różnice cond_a − cond_b z listy dictów compute_evokeds (jeden na badanego)."""
+    first = evoked_dicts[0][cond_a]
+    x = np.stack([ev[cond_a].data - ev[cond_b].data for ev in evoked_dicts])
+    return cluster_test_paired(x, first.ch_names, first.times, **kwargs)
+
+
+def cluster_test_lateralized(evoked_dicts, condition="left_valid", pairs=None, **kwargs):
+    """
+    Test klastrowy różnic contra − ipsi w kohorcie (pary homologiczne × czas) dla warunku condition.
+    Sąsiedztwo par wg kanału lewej półkuli; kanały w wyniku nazwane "L/R".
+    """
+    lats = [lateralized_waves(ev, pairs=pairs, conditions=[condition]) for ev in evoked_dicts]
+    pairs = lats[0]["pairs"]
+    x = np.stack([lat["diff"][0] for lat in lats])
+    left = {l: f"{l}/{r}" for l, r in pairs}
+    adjacency = {left[ch]: [left[nb] for nb in nbs if nb in left]
+                 for ch, nbs in (kwargs.pop("adjacency", None) or ADJACENCY_10_20).items() if ch in left}
+    return cluster_test_paired(x, list(left.values()), lats[0]["times"], adjacency=adjacency, **kwargs)
+
+
+def cluster_test_epochs(epochs, cond_a="valid", cond_b="invalid", **kwargs):
+    """
+    Test klastrowy na poziomie prób jednego badanego (mne.Epochs): cond_a vs cond_b, tasowanie etykiet.
+    Warunek to nazwa z event_id, nazwa zbiorcza (valid/invalid) lub lista nazw.
+    """
+    def select(cond):
+        conds = POOLED_CONDITIONS.get(cond, [cond]) if isinstance(cond, str) else list(cond)
+        return epochs[conds].get_data(copy=False)
+
+    return cluster_test_independent(select(cond_a), select(cond_b), epochs.ch_names, epochs.times, **kwargs)
+
+
+def clusters_table(result, times_ms=True):
+    """Klastry z testu jako DataFrame: Znak, Masa, p, Kanały, Od, Do (ms)."""
+    scale = 1000 if times_ms else 1
+    return pd.DataFrame([
+        {
+            "Znak": "+" if c["sign"] > 0 else "−", "Masa": round(c["mass"], 2), "p": c["p"],
+            "Kanały": " ".join(c["channels"]), "Od": c["tmin"] * scale, "Do": c["tmax"] * scale,
+        }
+        for c in result["clusters"]
+    ], columns=["Znak", "Masa", "p", "Kanały", "Od", "Do"])
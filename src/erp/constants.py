@@ -1,12 +1,12 @@
 # -*- coding: utf-8 -*-
 """Stałe dla analizy ERP (Posner)."""
 
+# Przesunięcie zdarzeń (monitor delay), sekundy — wspólne z analizą RT (src/constants.py)
+from ..constants import MONITOR_DELAY_SEC
+
 # Epoki z błędną odpowiedzią (indeksy od 0)
 WRONG_ANS = [95, 153, 172, 173, 174, 186, 339, 405]
 
-# Przesunięcie zdarzeń (monitor delay), sekundy
-MONITOR_DELAY_SEC = 0.042
-
 # Nazwy kanałów 10-20 (19 kanałów)
 CH_NAMES_10_20 = [
     "Fp1", "F3", "F7", "C3", "T3", "P3", "T5",
@@ -31,9 +31,19 @@ EVENT_DICT = {
 # Kanały do detekcji artefaktów ocznych
 KANALY_OCZNE = ["Fp1", "Fp2", "F7"]
 
+# Pary homologiczne 10-20 (lewa, prawa półkula) do fal ipsi/contra
+HOMOLOGOUS_PAIRS = [
+    ("Fp1", "Fp2"), ("F3", "F4"), ("F7", "F8"), ("C3", "C4"),
+    ("T3", "T4"), ("P3", "P4"), ("T5", "T6"), ("O1", "O2"),
+]
+
 # Okno czasowe dla artefaktów (s)
 TMIN_ARTEFAKT, TMAX_ARTEFAKT = 0.0, 0.6
 
+# Próg artefaktów ocznych: percentyl maks. PtP przycięty do granic (V)
+OCULAR_PERCENTILE = 95
+OCULAR_THRESHOLD_LIMITS = (60e-6, 100e-6)
+
 # Okna czasowe pików ERP (ms): (tmin, tmax)
 PEAK_WINDOWS = {
     "N70": (50, 85),
@@ -41,3 +51,71 @@ PEAK_WINDOWS = {
     "N1": (130, 200),
     "P3": (200, 600),
 }
+
+# Latencja frakcyjna (jackknife_peaks): ułamek amplitudy piku / pola pod krzywą w oknie
+JACKKNIFE_FRACTION = 0.5
+
+# Piki z weryfikacją sekwencji P1 -> N1 -> P3 (find_peaks_validated), czasy w ms:
+# N1 w [lat P1 + n1_offset, n1_end], P3 w [lat N1 + p3_offset, p3_end], P3 przyjęty gdy |P3| >= p3_min_ratio * |N1|
+VALIDATED_PEAK_PARAMS = {
+    "n70_window": (50, 90),
+    "p1_window": (90, 130),
+    "n1_offset": 20,
+    "n1_end": 200,
+    "p3_offset": 50,
+    "p3_end": 600,
+    "p3_min_ratio": 0.7,
+}
+
+# Cache zdekodowanych plików .smr (katalog i limit rozmiaru w bajtach)
+SMR_CACHE_DIR = "data/.smr_cache"
+SMR_CACHE_MAX_BYTES = 20 * 1024**3
+
+# Sąsiedztwo elektrod 10-20 (dla CH_NAMES_10_20) do testów klastrowych
+ADJACENCY_10_20 = {
+    "Fp1": ["Fp2", "F7", "F3", "Fz"],
+    "Fp2": ["Fp1", "Fz", "F4", "F8"],
+    "F7": ["Fp1", "F3", "T3"],
+    "F3": ["Fp1", "F7", "Fz", "C3"],
+    "Fz": ["Fp1", "Fp2", "F3", "F4", "Cz"],
+    "F4": ["Fp2", "Fz", "F8", "C4"],
+    "F8": ["Fp2", "F4", "T4"],
+    "T3": ["F7", "C3", "T5"],
+    "C3": ["F3", "T3", "Cz", "P3"],
+    "Cz": ["Fz", "C3", "C4", "Pz"],
+    "C4": ["F4", "Cz", "T4", "P4"],
+    "T4": ["F8", "C4", "T6"],
+    "T5": ["T3", "P3", "O1"],
+    "P3": ["C3", "T5", "Pz", "O1"],
+    "Pz": ["Cz", "P3", "P4", "O1", "O2"],
+    "P4": ["C4", "Pz", "T6", "O2"],
+    "T6": ["T4", "P4", "O2"],
+    "O1": ["T5", "P3", "Pz", "O2"],
+    "O2": ["O1", "Pz", "P4", "T6"],
+}
+
+# Test permutacyjny klastrów: liczba permutacji, alfa, budżet pamięci na partię (MB)
+CLUSTER_N_PERM = 10000
+CLUSTER_ALPHA = 0.05
+CLUSTER_MAX_MEMORY_MB = 256
+
+# Profile eksportu wykresów ERP (export_erp_figures): podgląd, publikacja, wektor
+ERP_FIGURE_PROFILES = {
+    "preview": {"dpi": 100, "fmt": "png"},
+    "publication": {"dpi": 300, "fmt": "png"},
+    "vector": {"dpi": 300, "fmt": "pdf"},
+}
+
+# Bootstrap pasm ufności ERP (bootstrap_bands): liczba prób, poziom ufności (%), budżet pamięci (MB)
+BOOTSTRAP_N = 1000
+BOOTSTRAP_CI = 95
+BOOTSTRAP_MAX_MEMORY_MB = 256
+
+# Detektory artefaktów (detect_artifacts): domyślne parametry, progi w V
+ARTIFACT_DETECTOR_PARAMS = {
+    "ptp": {"threshold": 100e-6},                    # amplituda peak-to-peak
+    "step": {"threshold": 50e-6, "window": 0.2},     # skok średnich dwóch połówek okna (s)
+    "flat": {"threshold": 0.5e-6},                   # płaski sygnał (PtP poniżej progu)
+    "gradient": {"threshold": 50e-6},                # maks. różnica kolejnych próbek
+    "zscore": {"threshold": 5.0},                    # odporny z-score PtP względem innych epok kanału
+}
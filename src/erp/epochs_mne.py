@@ -6,13 +6,17 @@ import mne
 
 
 def uv_to_v_if_needed(raw, verbose=True):
-    """Jeśli dane w Raw są w µV (max > 1e-3 V), konwertuje na V i zwraca nowy Raw."""
-    data = raw.get_data()
+    """
+    Jeśli dane w Raw są w µV (max > 1e-3 V), zwraca nowy Raw w V (jedna przeskalowana kopia);
+    wejściowy Raw i jego bufor (np. eeg_data z block_to_raw) pozostają bez zmian.
+    Gdy znane są jednostki Neo, lepiej block_to_raw(..., to_volts=True) — skalowanie bez kopii.
+    """
+    raw.load_data()
+    data = raw._data
     if data.max() > 1e-3:
         if verbose:
             print("Dane w µV, konwertuję na V...")
-        data = data * 1e-6
-        raw = mne.io.RawArray(data, raw.info)
+        raw = mne.io.RawArray(data * 1e-6, raw.info, first_samp=raw.first_samp, verbose=verbose)
     return raw
 
 
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Strumieniowe wycinanie epok z zapisu (mmap / cache .smr) bez wczytywania całego sygnału."""
+
+import numpy as np
+import mne
+from mne.baseline import rescale
+
+
+def epoch_windows(events, sfreq, tmin=-0.2, tmax=0.8, first_samp=0, n_samples=None):
+    """
+    Próbki początkowe okien tmin..tmax dla każdego zdarzenia (jak w mne.Epochs).
+    Zwraca (starts, keep, times): keep = okno mieści się w zapisie (n_samples).
+    """
+    start_off = int(round(tmin * sfreq))
+    stop_off = int(round(tmax * sfreq))
+    times = np.arange(start_off, stop_off + 1) / sfreq
+    starts = np.asarray(events)[:, 0] - first_samp + start_off
+    keep = starts >= 0
+    if n_samples is not None:
+        keep &= starts + len(times) <= n_samples
+    return starts, keep, times
+
+
+def iter_epoch_batches(data, events, sfreq, event_id=None, tmin=-0.2, tmax=0.8, baseline=(-0.1, 0),
+                       first_samp=0, picks=None, batch_size=256, scale=None):
+    """
+    Generator epok w paczkach po batch_size, czytanych wprost z data (kanały × czas,
+    np. np.memmap z open_smr_cache) — w pamięci jest tylko bieżąca paczka.
+    Korekta linii bazowej (średnia) liczona dla każdej paczki osobno.
+    scale: opcjonalny mnożnik jednostek (np. 1e-6 dla µV -> V).
+    Zwraca kolejno (batch, batch_events, batch_idx): batch (epoki × kanały × czas),
+    batch_idx — indeksy zdarzeń w events (jak epochs.selection).
+    """
+    events = np.asarray(events)
+    starts, keep, times = epoch_windows(events, sfreq, tmin, tmax, first_samp, n_samples=data.shape[1])
+    if event_id is not None:
+        keep &= np.isin(events[:, 2], list(event_id.values()))
+    selection = np.flatnonzero(keep)
+    ch_idx = np.arange(data.shape[0]) if picks is None else np.asarray(picks)
+    offsets = np.arange(len(times))
+    for i in range(0, len(selection), batch_size):
+        batch_idx = selection[i:i + batch_size]
+        win = starts[batch_idx, None] + offsets  # (n_batch, n_times)
+        batch = np.asarray(data[ch_idx[:, None, None], win[None]], dtype=np.float64).transpose(1, 0, 2)
+        batch = np.ascontiguousarray(batch)
+        if scale is not None:
+            batch *= scale
+        if baseline is not None:
+            rescale(batch, times, baseline, mode="mean", copy=False, verbose=False)
+        yield batch, events[batch_idx], batch_idx
+
+
+def epochs_from_stream(data, events, sfreq, event_dict, ch_names, tmin=-0.2, tmax=0.8, baseline=(-0.1, 0),
+                       first_samp=0, picks=None, batch_size=256, scale=None, verbose=True):
+    """
+    Składa epoki z iter_epoch_batches w mne.EpochsArray (jak mne.Epochs(..., preload=True),
+    ale bez ładowania całego zapisu). Pamięć rośnie z liczbą epok, nie z długością nagrania.
+    ValueError, gdy żadne okno zdarzenia nie mieści się w zapisie.
+    """
+    batches, ev_list, sel_list = [], [], []
+    for batch, batch_events, batch_idx in iter_epoch_batches(
+        data, events, sfreq, event_id=event_dict, tmin=tmin, tmax=tmax, baseline=baseline,
+        first_samp=first_samp, picks=picks, batch_size=batch_size, scale=scale,
+    ):
+        batches.append(batch)
+        ev_list.append(batch_events)
+        sel_list.append(batch_idx)
+    if not batches:
+        raise ValueError(
+            f"Brak epok: żadne okno {tmin}..{tmax} s wokół zdarzeń z event_dict "
+            f"nie mieści się w zapisie ({data.shape[1]} próbek, first_samp={first_samp})"
+        )
+    if picks is not None:
+        ch_names = [ch_names[i] for i in picks]
+    info = mne.create_info(ch_names=list(ch_names), sfreq=sfreq, ch_types=["eeg"] * len(ch_names))
+    epochs = mne.EpochsArray(
+        np.concatenate(batches), info, events=np.concatenate(ev_list), tmin=tmin,
+        event_id=event_dict, baseline=baseline, selection=np.concatenate(sel_list), verbose=False,
+    )
+    if verbose:
+        print(epochs)
+        for k in event_dict:
+            print(f"{k}: {len(epochs[k])} trials")
+    return epochs
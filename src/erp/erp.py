@@ -5,8 +5,14 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Patch
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import mne
 
+from .constants import ERP_FIGURE_PROFILES
+from .selection import epochs_buffer
+from .lateralization import lateralized_waves
+
 # Kolory
 C_VALID, C_INVALID = "#2d2d2d", "#6d6d6d"
 C_DIFF1, C_DIFF2 = "#404040", "#5a5a5a"
@@ -15,23 +21,131 @@ C_P1, C_N1, C_P3 = "#c4d4c4", "#b8c4d8", "#d4c4b8"
 PICKS_OCCIPITAL = ["O1", "O2"]
 PICKS_PARIETAL = ["P3", "P4"]
 PICKS_CENTRAL = ["C3", "C4"]
+# (para lewa/prawa, nazwa regionu w tytule, przyrostek pliku)
+PLOT_PAIRS = [
+    (tuple(PICKS_OCCIPITAL), "", ""),
+    (tuple(PICKS_PARIETAL), "PARIETAL", "_Parietal"),
+    (tuple(PICKS_CENTRAL), "CENTRAL", "_Central"),
+]
+
+
+CONDITIONS = ["left_valid", "left_invalid", "right_valid", "right_invalid"]
+POOLED_CONDITIONS = {"valid": ["left_valid", "right_valid"], "invalid": ["left_invalid", "right_invalid"]}
+
+
+def condition_groups(event_id, conditions=None, pooled=None):
+    """
+    Domyślne warunki (CONDITIONS obecne w event_id) i zbiorcze (POOLED_CONDITIONS, których
+    wszystkie składowe są w conditions). Zwraca (conditions, groups): groups = nazwa -> warunki składowe.
+    """
+    if conditions is None:
+        conditions = [c for c in CONDITIONS if c in event_id]
+    if pooled is None:
+        pooled = {k: v for k, v in POOLED_CONDITIONS.items() if all(c in conditions for c in v)}
+    groups = {c: [c] for c in conditions}
+    groups.update(pooled)
+    return conditions, groups
+
+
+def grouped_sums(data, codes, group_codes, keep=None, chunk=256, return_m2=False):
+    """
+    Jedno przejście po epokach (porcjami po chunk): sumy i liczebności dla każdego kodu
+    z group_codes. data: (epoki, kanały, czas); keep: opcjonalna maska epok.
+    return_m2=True liczy też M2 (suma kwadratów odchyleń od średniej grupy) stabilnie:
+    każda porcja centrowana średnią swojej grupy i łączona z poprzednimi wzorem Chana.
+    Zwraca (sums, m2, counts) o kształtach (grupy, kanały, czas) i (grupy,); m2 = None bez return_m2.
+    """
+    codes = np.asarray(codes)
+    group_codes = np.asarray(group_codes)
+    member = codes[None, :] == group_codes[:, None]
+    if keep is not None:
+        member &= np.asarray(keep, dtype=bool)[None, :]
+    n_groups, shape = len(group_codes), data.shape[1:]
+    sums = np.zeros((n_groups, int(np.prod(shape))))
+    m2 = np.zeros_like(sums) if return_m2 else None
+    n_a = np.zeros(n_groups)
+    for start in range(0, len(codes), chunk):
+        stop = min(start + chunk, len(codes))
+        g = member[:, start:stop].astype(np.float64)
+        if not g.any():
+            continue
+        block = np.asarray(data[start:stop], dtype=np.float64).reshape(stop - start, -1)
+        part = g @ block
+        if return_m2:
+            # każda epoka należy do co najwyżej jednej grupy (różne kody)
+            n_b = g.sum(axis=1)
+            mean_b = part / np.maximum(n_b, 1)[:, None]
+            inside = g.any(axis=0)
+            centered = block[inside] - mean_b[g[:, inside].argmax(axis=0)]
+            n = n_a + n_b
+            delta = mean_b - sums / np.maximum(n_a, 1)[:, None]
+            m2 += g[:, inside] @ (centered * centered)
+            m2 += delta * delta * (n_a * n_b / np.maximum(n, 1))[:, None]
+            n_a = n
+        sums += part
+    if return_m2:
+        m2 = m2.reshape((n_groups,) + shape)
+    return sums.reshape((n_groups,) + shape), m2, member.sum(axis=1)
 
 
-def compute_evokeds(epochs, verbose=True):
-    """Oblicza evoked dla left_valid, left_invalid, right_valid, right_invalid. Zwraca dict."""
-    ev = {
-        "left_valid": epochs["left_valid"].average(),
-        "left_invalid": epochs["left_invalid"].average(),
-        "right_valid": epochs["right_valid"].average(),
-        "right_invalid": epochs["right_invalid"].average(),
-    }
-    ev["valid"] = epochs["left_valid", "right_valid"].average()
-    ev["invalid"] = epochs["left_invalid", "right_invalid"].average()
+def _pool_moments(counts, means, m2s):
+    """Łączy (n, średnia, M2) kilku grup wzorem Chana. Zwraca (n, mean, m2)."""
+    n, mean, m2 = 0, np.zeros_like(means[0]), np.zeros_like(m2s[0])
+    for n_b, mean_b, m2_b in zip(counts, means, m2s):
+        if n_b == 0:
+            continue
+        total = n + n_b
+        delta = mean_b - mean
+        mean = mean + delta * (n_b / total)
+        m2 = m2 + m2_b + delta * delta * (n * n_b / total)
+        n = total
+    return n, mean, m2
+
+
+def grouped_average(epochs, conditions=None, pooled=None, return_se=False, chunk=256):
+    """
+    Evoked dla wielu warunków z jednego przejścia po danych (Epochs lub MaskedEpochs).
+    Warunki zbiorcze (pooled, np. valid = left_valid + right_valid) liczone są z sum
+    warunków składowych, bez ponownego czytania prób. return_se=True zwraca też
+    (ev, se): błąd standardowy średniej jako Evoked (z M2 porcji centrowanych, ten sam przebieg).
+    Warunek bez zachowanych prób daje Evoked z nave=0 i danymi NaN (piki -> NaN), nie zera.
+    """
+    conditions, groups = condition_groups(epochs.event_id, conditions, pooled)
+    data, keep, base = epochs_buffer(epochs)
+    group_codes = [epochs.event_id[c] for c in conditions]
+    sums, m2, counts = grouped_sums(data, base.events[:, 2], group_codes, keep=keep, chunk=chunk,
+                                    return_m2=return_se)
+    pos = {c: i for i, c in enumerate(conditions)}
+    ev, se = {}, {}
+    for name, members in groups.items():
+        idx = [pos[c] for c in members]
+        n = int(counts[idx].sum())
+        mean = sums[idx].sum(axis=0) / n if n else np.full(sums.shape[1:], np.nan)
+        kwargs = dict(info=base.info, tmin=base.tmin, nave=n, verbose=False)
+        ev[name] = mne.EvokedArray(mean, comment=" + ".join(members), baseline=base.baseline, **kwargs)
+        if return_se:
+            means = sums[idx] / np.maximum(counts[idx], 1)[:, None, None]
+            _, _, m2_pooled = _pool_moments(counts[idx], means, m2[idx])
+            var = m2_pooled / max(n - 1, 1)
+            # bez baseline — EvokedArray odjąłby ją od przebiegu SE
+            sem = np.sqrt(var / n) if n else np.full(sums.shape[1:], np.nan)
+            se[name] = mne.EvokedArray(sem, comment=f"SE {name}", **kwargs)
+    return (ev, se) if return_se else ev
+
+
+def compute_evokeds(epochs, verbose=True, return_se=False):
+    """
+    Oblicza evoked dla left_valid, left_invalid, right_valid, right_invalid oraz valid/invalid.
+    Zwraca dict (lub (dict, dict SE) gdy return_se=True). Wszystkie warunki z jednego
+    przejścia po epokach (grouped_average); epochs może być MaskedEpochs (bez kopii epok).
+    """
+    res = grouped_average(epochs, conditions=CONDITIONS, pooled=POOLED_CONDITIONS, return_se=return_se)
+    ev = res[0] if return_se else res
     if verbose:
         print("\n✓ ERP utworzone (epoki po odrzuceniu artefaktów)")
-        for k in ["left_valid", "left_invalid", "right_valid", "right_invalid"]:
-            print(f"  {k}: {len(epochs[k])} epok")
-    return ev
+        for k in CONDITIONS:
+            print(f"  {k}: {ev[k].nave} epok")
+    return res
 
 
 def _style_ax(ax, ylim=None):
@@ -54,15 +168,19 @@ def _style_ax(ax, ylim=None):
     return p1, n1, p3
 
 
-def _plot_ipsi_contra(evoked_valid, evoked_invalid, picks, ipsi_idx, contra_idx,
-                      title_prefix, save_path, times_ms, ylim_erp, ylim_diff):
-    data_v = evoked_valid.copy().pick_channels(picks).data * 1e6
-    data_i = evoked_invalid.copy().pick_channels(picks).data * 1e6
-    diff = data_v - data_i
-    ipsi_v, ipsi_i = data_v[ipsi_idx, :], data_i[ipsi_idx, :]
-    contra_v, contra_i = data_v[contra_idx, :], data_i[contra_idx, :]
-    ipsi_d, contra_d = diff[ipsi_idx, :], diff[contra_idx, :]
+def _plot_ipsi_contra(ipsi_v, ipsi_i, contra_v, contra_i,
+                      title_prefix, save_path, times_ms, ylim_erp, ylim_diff, bands=None):
+    """
+    Panele ipsi/contra (µV) dla jednej pary i strony wskazówki: poprawna vs niepoprawna i różnica.
+    bands: opcjonalny dict (ipsi_v, ipsi_i, contra_v, contra_i, ipsi_d, contra_d) -> (dolna, górna) µV.
+    """
+    ipsi_d, contra_d = ipsi_v - ipsi_i, contra_v - contra_i
     fig, axes = plt.subplots(2, 2, figsize=(14, 8))
+    if bands:
+        for ax, key, color in [(axes[0, 0], "ipsi_v", C_VALID), (axes[0, 0], "ipsi_i", C_INVALID),
+                               (axes[0, 1], "contra_v", C_VALID), (axes[0, 1], "contra_i", C_INVALID),
+                               (axes[1, 0], "ipsi_d", C_DIFF1), (axes[1, 1], "contra_d", C_DIFF2)]:
+            ax.fill_between(times_ms, *bands[key], color=color, alpha=0.15, linewidth=0)
     axes[0, 0].plot(times_ms, ipsi_v, label="Poprawna", color=C_VALID, linewidth=2)
     axes[0, 0].plot(times_ms, ipsi_i, label="Niepoprawna", color=C_INVALID, linestyle="--", linewidth=2)
     axes[0, 0].set_ylabel("Amplituda (µV)")
@@ -91,55 +209,145 @@ def _plot_ipsi_contra(evoked_valid, evoked_invalid, picks, ipsi_idx, contra_idx,
     plt.show()
 
 
-def get_global_ylim(evoked_dict):
+def _plot_pairs_waves(evoked_dict):
+    """Fale ipsi/contra (µV) dla par z PLOT_PAIRS — jedno indeksowanie zamiast kopii Evoked."""
+    lat = lateralized_waves(evoked_dict, pairs=[pair for pair, _, _ in PLOT_PAIRS], conditions=CONDITIONS)
+    return lat["ipsi"] * 1e6, lat["contra"] * 1e6
+
+
+def get_global_ylim(evoked_dict, waves=None):
     """Oblicza wspólne limity Y dla ERP i różnicy z evoked (O1,O2,P3,P4,C3,C4)."""
-    picks_list = [PICKS_OCCIPITAL, PICKS_PARIETAL, PICKS_CENTRAL]
-    all_erp, all_diff = [], []
-    for picks in picks_list:
-        for k in ["left_valid", "left_invalid", "right_valid", "right_invalid"]:
-            d = evoked_dict[k].copy().pick_channels(picks).data * 1e6
-            all_erp.append(d.ravel())
-        for side in ["left", "right"]:
-            v = evoked_dict[f"{side}_valid"].copy().pick_channels(picks).data * 1e6
-            i = evoked_dict[f"{side}_invalid"].copy().pick_channels(picks).data * 1e6
-            all_diff.append((v - i).ravel())
-    ymax_erp = float(np.ceil(np.max(np.abs(np.concatenate(all_erp))) * 1.05))
-    ymax_diff = float(np.ceil(np.max(np.abs(np.concatenate(all_diff))) * 1.05))
+    ipsi, contra = waves if waves is not None else _plot_pairs_waves(evoked_dict)
+    erp = np.stack([ipsi, contra])
+    diff = erp[:, 0::2] - erp[:, 1::2]  # left_valid − left_invalid, right_valid − right_invalid
+    ymax_erp = float(np.ceil(np.nanmax(np.abs(erp)) * 1.05))  # nanmax: warunek bez prób (NaN)
+    ymax_diff = float(np.ceil(np.nanmax(np.abs(diff)) * 1.05))
     return (-ymax_erp, ymax_erp), (-ymax_diff, ymax_diff)
 
 
-def plot_all_erp(evoked_dict, save_prefix="ERP", output_dir="results"):
-    """Rysuje wszystkie panele ERP (LEFT/RIGHT occipital, parietal, central) i zapisuje PNG do output_dir."""
+def _band_panels(bands):
+    """Pasma (lo, hi) z bootstrap_bands jako tablice ipsi/contra (µV): (2 × warunki+różnice × pary × czas)."""
+    conditions = CONDITIONS + ["left_diff", "right_diff"]
+    pairs = [pair for pair, _, _ in PLOT_PAIRS]
+    lats = [lateralized_waves(b, pairs=pairs, conditions=conditions) for b in bands]
+    return (np.stack([lat["ipsi"] for lat in lats]) * 1e6,
+            np.stack([lat["contra"] for lat in lats]) * 1e6)
+
+
+def _erp_panels(evoked_dict, save_prefix, bands=None):
+    """
+    Sześć paneli ERP: lista (ipsi_v, ipsi_i, contra_v, contra_i, tytuł, nazwa pliku bez rozszerzenia, pasma)
+    oraz wspólne limity Y (ylim_erp, ylim_diff) — z pasmami, jeśli podano bands = (lo, hi).
+    """
+    ipsi, contra = _plot_pairs_waves(evoked_dict)
+    ylim_erp, ylim_diff = get_global_ylim(evoked_dict, waves=(ipsi, contra))
+    ci = {c: i for i, c in enumerate(CONDITIONS + ["left_diff", "right_diff"])}
+    if bands is not None:
+        b_ipsi, b_contra = _band_panels(bands)
+        b_all = np.abs(np.stack([b_ipsi, b_contra]))
+        ymax_erp = float(np.ceil(b_all[:, :, :4].max() * 1.05))
+        ymax_diff = float(np.ceil(b_all[:, :, 4:].max() * 1.05))
+        ylim_erp = (-max(ylim_erp[1], ymax_erp), max(ylim_erp[1], ymax_erp))
+        ylim_diff = (-max(ylim_diff[1], ymax_diff), max(ylim_diff[1], ymax_diff))
+    panels = []
+    for p, ((left, right), region, suffix) in enumerate(PLOT_PAIRS):
+        region = f" {region}" if region else ""
+        for side, label, ch_ipsi, ch_contra in [("left", "LEWA", left, right), ("right", "PRAWA", right, left)]:
+            v, i, d = ci[f"{side}_valid"], ci[f"{side}_invalid"], ci[f"{side}_diff"]
+            panel_bands = None
+            if bands is not None:
+                panel_bands = {
+                    "ipsi_v": b_ipsi[:, v, p], "ipsi_i": b_ipsi[:, i, p], "ipsi_d": b_ipsi[:, d, p],
+                    "contra_v": b_contra[:, v, p], "contra_i": b_contra[:, i, p], "contra_d": b_contra[:, d, p],
+                }
+            panels.append((
+                ipsi[v, p], ipsi[i, p], contra[v, p], contra[i, p],
+                f"{label}{region} ({ch_ipsi} ipsi, {ch_contra} contra)",
+                f"{save_prefix}_{side.upper()}{suffix}_ipsi_contra", panel_bands,
+            ))
+    return panels, ylim_erp, ylim_diff
+
+
+def plot_all_erp(evoked_dict, save_prefix="ERP", output_dir="results", bands=None):
+    """
+    Rysuje wszystkie panele ERP (LEFT/RIGHT occipital, parietal, central) i zapisuje PNG do output_dir.
+    bands: opcjonalnie (lo, hi) z bootstrap_bands — pasma ufności wokół fal i różnic.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    times_ms = evoked_dict["left_valid"].times * 1000
+    panels, ylim_erp, ylim_diff = _erp_panels(evoked_dict, save_prefix, bands=bands)
+    for *waves, title, stem, panel_bands in panels:
+        _plot_ipsi_contra(*waves, title, os.path.join(output_dir, f"{stem}.png"), times_ms, ylim_erp, ylim_diff,
+                          bands=panel_bands)
+
+
+class ErpFigureTemplate:
+    """
+    Szablon figury 2×2 ipsi/contra poza pyplot (Figure + Agg): siatka, okna P1/N1/P3
+    i legendy rysowane raz, a render() podmienia tylko dane linii, tytuły i limity Y.
+    """
+
+    def __init__(self, times_ms):
+        self.times_ms = np.asarray(times_ms)
+        self.fig = Figure(figsize=(14, 8))
+        FigureCanvasAgg(self.fig)
+        axes = self.fig.subplots(2, 2)
+        self.axes = axes
+        zeros = np.zeros_like(self.times_ms)
+        self.lines = {}
+        for col, kind in enumerate(["ipsi", "contra"]):
+            ax = axes[0, col]
+            self.lines[kind, "v"], = ax.plot(self.times_ms, zeros, label="Poprawna", color=C_VALID, linewidth=2)
+            self.lines[kind, "i"], = ax.plot(self.times_ms, zeros, label="Niepoprawna", color=C_INVALID, linestyle="--", linewidth=2)
+            ax.set_ylabel("Amplituda (µV)")
+            p1, n1, p3 = _style_ax(ax)
+            if col == 0:
+                handles, labels = ax.get_legend_handles_labels()
+                ax.legend(handles + [p1, n1, p3], labels + ["P1", "N1", "LPD/P3"], loc="upper right")
+            else:
+                ax.legend(loc="upper right")
+            ax = axes[1, col]
+            self.lines[kind, "d"], = ax.plot(self.times_ms, zeros, color=C_DIFF1 if col == 0 else C_DIFF2, linewidth=2.5)
+            ax.set_ylabel("Różnica amplitudy (µV)")
+            _style_ax(ax)
+        axes[1, 0].legend([Patch(facecolor=C_P1, alpha=0.6), Patch(facecolor=C_N1, alpha=0.6), Patch(facecolor=C_P3, alpha=0.6)], ["P1", "N1", "LPD/P3"])
+        for ax in axes.ravel():
+            ax.set_title(" ")  # miejsce na tytuł przy liczeniu układu
+        self.fig.tight_layout()
+        self.fig.set_layout_engine(None)  # układ liczony raz, nie przy każdym zapisie
+
+    def render(self, ipsi_v, ipsi_i, contra_v, contra_i, title_prefix, save_path, ylim_erp, ylim_diff,
+               dpi=100, fmt="png"):
+        """Podmienia dane (µV) i zapisuje figurę do save_path."""
+        waves = {"ipsi": (ipsi_v, ipsi_i), "contra": (contra_v, contra_i)}
+        for col, kind in enumerate(["ipsi", "contra"]):
+            v, i = waves[kind]
+            self.lines[kind, "v"].set_ydata(v)
+            self.lines[kind, "i"].set_ydata(i)
+            self.lines[kind, "d"].set_ydata(v - i)
+            self.axes[0, col].set_title(f"{title_prefix} {kind} Poprawna vs Niepoprawna")
+            self.axes[1, col].set_title(f"{title_prefix} {kind} Poprawna − Niepoprawna")
+            self.axes[0, col].set_ylim(ylim_erp)
+            self.axes[1, col].set_ylim(ylim_diff)
+        self.fig.savefig(save_path, dpi=dpi, format=fmt)
+        return save_path
+
+
+def export_erp_figures(evoked_dict, save_prefix="ERP", output_dir="results", profile="preview", template=None):
+    """
+    Eksport sześciu paneli ERP (jak plot_all_erp) bez pyplot i bez wyświetlania.
+    profile: klucz ERP_FIGURE_PROFILES ("preview", "publication", "vector") lub dict {dpi, fmt}.
+    template: ErpFigureTemplate do ponownego użycia (np. dla wielu badanych). Zwraca listę ścieżek.
+    """
+    if isinstance(profile, str):
+        profile = ERP_FIGURE_PROFILES[profile]
     os.makedirs(output_dir, exist_ok=True)
     times_ms = evoked_dict["left_valid"].times * 1000
-    ylim_erp, ylim_diff = get_global_ylim(evoked_dict)
-    _plot_ipsi_contra(
-        evoked_dict["left_valid"], evoked_dict["left_invalid"],
-        PICKS_OCCIPITAL, 0, 1, "LEWA (O1 ipsi, O2 contra)",
-        os.path.join(output_dir, f"{save_prefix}_LEFT_ipsi_contra.png"), times_ms, ylim_erp, ylim_diff,
-    )
-    _plot_ipsi_contra(
-        evoked_dict["right_valid"], evoked_dict["right_invalid"],
-        PICKS_OCCIPITAL, 1, 0, "PRAWA (O2 ipsi, O1 contra)",
-        os.path.join(output_dir, f"{save_prefix}_RIGHT_ipsi_contra.png"), times_ms, ylim_erp, ylim_diff,
-    )
-    _plot_ipsi_contra(
-        evoked_dict["left_valid"], evoked_dict["left_invalid"],
-        PICKS_PARIETAL, 0, 1, "LEWA PARIETAL (P3 ipsi, P4 contra)",
-        os.path.join(output_dir, f"{save_prefix}_LEFT_Parietal_ipsi_contra.png"), times_ms, ylim_erp, ylim_diff,
-    )
-    _plot_ipsi_contra(
-        evoked_dict["right_valid"], evoked_dict["right_invalid"],
-        PICKS_PARIETAL, 1, 0, "PRAWA PARIETAL (P4 ipsi, P3 contra)",
-        os.path.join(output_dir, f"{save_prefix}_RIGHT_Parietal_ipsi_contra.png"), times_ms, ylim_erp, ylim_diff,
-    )
-    _plot_ipsi_contra(
-        evoked_dict["left_valid"], evoked_dict["left_invalid"],
-        PICKS_CENTRAL, 0, 1, "LEWA CENTRAL (C3 ipsi, C4 contra)",
-        os.path.join(output_dir, f"{save_prefix}_LEFT_Central_ipsi_contra.png"), times_ms, ylim_erp, ylim_diff,
-    )
-    _plot_ipsi_contra(
-        evoked_dict["right_valid"], evoked_dict["right_invalid"],
-        PICKS_CENTRAL, 1, 0, "PRAWA CENTRAL (C4 ipsi, C3 contra)",
-        os.path.join(output_dir, f"{save_prefix}_RIGHT_Central_ipsi_contra.png"), times_ms, ylim_erp, ylim_diff,
-    )
+    if template is None or not np.array_equal(template.times_ms, times_ms):
+        template = ErpFigureTemplate(times_ms)
+    panels, ylim_erp, ylim_diff = _erp_panels(evoked_dict, save_prefix)
+    return [
+        template.render(*waves, title, os.path.join(output_dir, f"{stem}.{profile['fmt']}"),
+                        ylim_erp, ylim_diff, dpi=profile["dpi"], fmt=profile["fmt"])
+        for *waves, title, stem, _ in panels
+    ]
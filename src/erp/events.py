@@ -1,30 +1,117 @@
 # -*- coding: utf-8 -*-
 """Budowanie tablicy zdarzeń MNE z segmentu Neo."""
 
+import warnings
+
 import numpy as np
+import quantities as pq
+
+from .constants import EVENT_MAPPING, EVENT_DICT, MONITOR_DELAY_SEC
+
 
-from .constants import EVENT_MAPPING, EVENT_DICT
+def _segment_offsets(segments, sfreq):
+    """Próbka początkowa każdego segmentu po sklejeniu sygnałów w kolejności listy."""
+    offsets = [int(round(float(segments[0].t_start.rescale(pq.s)) * sfreq))]
+    for seg in segments[:-1]:
+        offsets.append(offsets[-1] + seg.analogsignals[0].shape[0])
+    return offsets
 
 
-def build_events(seg, sfreq, event_mapping=None, verbose=True):
+def build_events(seg, sfreq, event_mapping=None, verbose=True, delay_sec=0.0, on_unknown="warn"):
     """
     Z segmentu Neo (zdarzenia) buduje events (n_events, 3) dla MNE.
     Zwraca (events, event_dict).
+
+    seg może być listą segmentów (kilka segmentów / plików): próbki kolejnych segmentów są
+    przesuwane o długość poprzednich, jak przy sklejeniu ich sygnałów w jeden Raw.
+    delay_sec: opóźnienie monitora dodawane jako całkowita liczba próbek.
+    Zdarzenia spoza event_mapping są pomijane; on_unknown: "raise", "warn" lub "ignore".
     """
     if event_mapping is None:
         event_mapping = EVENT_MAPPING
-    events_list = []
-    for event in seg.events:
-        event_name = event.name
-        event_id = event_mapping.get(event_name, 0)
-        times = event.times.magnitude
-        samples = (times * sfreq).astype(int)
-        for sample in samples:
-            events_list.append([sample, 0, event_id])
-        if verbose:
-            print(f"{event_name}: {len(times)} zdarzeń, kod {event_id}")
-    events = np.array(events_list)
-    events = events[events[:, 0].argsort()]
+    if on_unknown not in ("raise", "warn", "ignore"):
+        raise ValueError(f"on_unknown musi być 'raise', 'warn' lub 'ignore', jest {on_unknown!r}")
+    segments = list(seg) if isinstance(seg, (list, tuple)) else [seg]
+    offsets = _segment_offsets(segments, sfreq)
+    delay_samples = int(round(delay_sec * sfreq))
+    samples_list, codes_list, unknown = [], [], {}
+    for seg_i, offset in zip(segments, offsets):
+        t_start = float(seg_i.t_start.rescale(pq.s))
+        for event in seg_i.events:
+            event_name = event.name
+            times = event.times.rescale(pq.s).magnitude
+            if event_name not in event_mapping:
+                unknown[event_name] = unknown.get(event_name, 0) + len(times)
+                continue
+            event_id = event_mapping[event_name]
+            samples_list.append(((times - t_start) * sfreq).astype(np.int64) + offset)
+            codes_list.append(np.full(len(times), event_id, dtype=np.int64))
+            if verbose:
+                print(f"{event_name}: {len(times)} zdarzeń, kod {event_id}")
+    if unknown:
+        msg = "Nieznane zdarzenia (pominięte): " + ", ".join(f"{k} ({n})" for k, n in unknown.items())
+        if on_unknown == "raise":
+            raise ValueError(msg)
+        if on_unknown == "warn":
+            warnings.warn(msg)
+    samples = np.concatenate(samples_list) if samples_list else np.zeros(0, dtype=np.int64)
+    codes = np.concatenate(codes_list) if codes_list else np.zeros(0, dtype=np.int64)
+    order = np.argsort(samples, kind="stable")
+    events = np.zeros((len(samples), 3), dtype=np.int64)
+    events[:, 0] = samples[order] + delay_samples
+    events[:, 2] = codes[order]
     if verbose:
         print(f"\nŁącznie zdarzeń: {len(events)}")
     return events, EVENT_DICT.copy()
+
+
+def apply_monitor_delay(events, sfreq, delay_sec=MONITOR_DELAY_SEC):
+    """
+    Przesuwa events o opóźnienie monitora w próbkach (bez przebudowy obiektów Neo).
+    delay_sec: skalar lub tablica (n_events,) z opóźnieniem każdej próby (np. z photodiode_delays).
+    Zwraca nową tablicę events.
+    """
+    events = np.array(events, dtype=np.int64, copy=True)
+    delay_samples = np.rint(np.asarray(delay_sec, dtype=float) * sfreq).astype(np.int64)
+    events[:, 0] += delay_samples
+    return events
+
+
+def detect_photodiode_onsets(photodiode, sfreq, threshold=None, min_interval_sec=0.2, first_samp=0):
+    """
+    Wykrywa początki bodźców na kanale fotodiody (1D, cały zapis) — wektorowo, bez pętli.
+    threshold: poziom przejścia; None = połowa między medianą (tło) a maksimum sygnału.
+    Przejścia bliżej niż min_interval_sec od poprzedniego są pomijane (migotanie ekranu).
+    Zwraca próbki początków (numeracja jak w events, z first_samp).
+    """
+    photodiode = np.asarray(photodiode)
+    if threshold is None:
+        threshold = (np.median(photodiode) + photodiode.max()) / 2
+    above = photodiode > threshold
+    onsets = np.flatnonzero(~above[:-1] & above[1:]) + 1
+    if len(onsets) > 1:
+        keep = np.concatenate(([True], np.diff(onsets) > min_interval_sec * sfreq))
+        onsets = onsets[keep]
+    return onsets + first_samp
+
+
+def photodiode_delays(events, onsets, sfreq, max_delay_sec=0.1, default_sec=MONITOR_DELAY_SEC, verbose=True):
+    """
+    Opóźnienie każdej próby: od triggera do pierwszego początku z fotodiody w oknie max_delay_sec.
+    Próby bez pasującego początku dostają default_sec. Zwraca tablicę (n_events,) w s
+    do apply_monitor_delay.
+    """
+    samples = np.asarray(events)[:, 0]
+    onsets = np.asarray(onsets)
+    idx = np.searchsorted(onsets, samples, side="left")
+    found = idx < len(onsets)
+    delay = np.full(len(samples), np.inf)
+    delay[found] = (onsets[idx[found]] - samples[found]) / sfreq
+    matched = delay <= max_delay_sec
+    delay[~matched] = default_sec
+    if verbose:
+        print(f"Fotodioda: dopasowano {matched.sum()}/{len(samples)} prób")
+        if matched.any():
+            d_ms = delay[matched] * 1000
+            print(f"  Opóźnienie: mediana {np.median(d_ms):.1f} ms, zakres {d_ms.min():.1f}–{d_ms.max():.1f} ms")
+    return delay
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Łączalne akumulatory evoked (średnia i wariancja bieżąca) do średnich grupowych."""
+
+import numpy as np
+import mne
+
+from .erp import grouped_sums, condition_groups
+from .selection import epochs_buffer
+
+
+class EvokedAccumulator:
+    """
+    Dla każdego warunku: liczba obserwacji n, średnia bieżąca i M2 (suma kwadratów odchyleń),
+    aktualizowane stabilnie (Welford / Chan et al.). Stała pamięć niezależnie od liczby badanych;
+    akumulatory z różnych procesów łączy merge(), a save()/load() przenoszą stan przez dysk.
+    add_evokeds: jeden Evoked = jedna obserwacja (średnia grupowa, SE między badanymi);
+    add_epochs: jedna próba = jedna obserwacja.
+    """
+
+    def __init__(self):
+        self.n = {}
+        self.mean = {}
+        self.m2 = {}
+        self.ch_names = None
+        self.ch_types = None
+        self.sfreq = None
+        self.tmin = None
+
+    def __repr__(self):
+        conds = ", ".join(f"{k}: {v}" for k, v in self.n.items())
+        return f"<EvokedAccumulator | {conds}>"
+
+    def _check_layout(self, ch_names, sfreq, tmin, ch_types):
+        if self.ch_names is None:
+            self.ch_names, self.ch_types = list(ch_names), list(ch_types)
+            self.sfreq, self.tmin = float(sfreq), float(tmin)
+        elif list(ch_names) != self.ch_names or not np.isclose(sfreq, self.sfreq) or not np.isclose(tmin, self.tmin):
+            raise ValueError("Niezgodne kanały, sfreq lub tmin między akumulatorami")
+
+    def _combine(self, cond, n_b, mean_b, m2_b):
+        """Łączy stan warunku z (n_b, mean_b, m2_b) — wzór Chana dla dwóch zbiorów."""
+        if n_b == 0:
+            return
+        n_a = self.n.get(cond, 0)
+        if n_a == 0:
+            mean_b = np.array(mean_b, dtype=np.float64)
+            # m2_b może być skalarem 0.0 (add) — M2 ma zawsze kształt średniej
+            self.n[cond], self.mean[cond], self.m2[cond] = n_b, mean_b, np.broadcast_to(m2_b, mean_b.shape).astype(np.float64)
+            return
+        n = n_a + n_b
+        delta = mean_b - self.mean[cond]
+        self.mean[cond] = self.mean[cond] + delta * (n_b / n)
+        self.m2[cond] = self.m2[cond] + m2_b + delta * delta * (n_a * n_b / n)
+        self.n[cond] = n
+
+    def add(self, cond, data):
+        """Dodaje jedną obserwację (kanały × czas) do warunku cond (krok Welforda)."""
+        self._combine(cond, 1, np.asarray(data, dtype=np.float64), 0.0)
+        return self
+
+    def add_evokeds(self, evoked_dict):
+        """Dodaje wynik compute_evokeds (dict warunek -> Evoked) jako jedną obserwację na warunek."""
+        for cond, evoked in evoked_dict.items():
+            if evoked.nave == 0:
+                continue
+            self._check_layout(evoked.ch_names, evoked.info["sfreq"], evoked.times[0], evoked.get_channel_types())
+            self.add(cond, evoked.data)
+        return self
+
+    def add_epochs(self, epochs, conditions=None, pooled=None, chunk=256):
+        """
+        Dodaje próby z mne.Epochs lub MaskedEpochs (tylko zachowane) porcjami po chunk prób:
+        średnia i M2 każdej porcji z danych centrowanych (grouped_sums) łączone ze stanem
+        wzorem Chana (_combine); warunki zbiorcze (valid/invalid) dostają porcje warunków składowych.
+        """
+        conditions, groups = condition_groups(epochs.event_id, conditions, pooled)
+        data, keep, base = epochs_buffer(epochs)
+        self._check_layout(base.ch_names, base.info["sfreq"], base.times[0], base.get_channel_types())
+        codes = base.events[:, 2]
+        group_codes = [epochs.event_id[c] for c in conditions]
+        pos = {c: i for i, c in enumerate(conditions)}
+        for start in range(0, len(codes), chunk):
+            sl = slice(start, start + chunk)
+            sums, m2, counts = grouped_sums(
+                data[sl], codes[sl], group_codes, keep=keep[sl],
+                chunk=chunk, return_m2=True,
+            )
+            for cond, members in groups.items():
+                for c in members:
+                    i = pos[c]
+                    self._combine(cond, int(counts[i]), sums[i] / max(counts[i], 1), m2[i])
+        return self
+
+    def merge(self, other):
+        """Dołącza stan innego akumulatora (np. z innego procesu). Zwraca self."""
+        if other.ch_names is None:
+            return self
+        self._check_layout(other.ch_names, other.sfreq, other.tmin, other.ch_types)
+        for cond in other.n:
+            self._combine(cond, other.n[cond], other.mean[cond], other.m2[cond])
+        return self
+
+    def _info(self):
+        return mne.create_info(self.ch_names, self.sfreq, self.ch_types)
+
+    def to_evokeds(self):
+        """Średnie grupowe jako dict warunek -> Evoked (nave = liczba obserwacji)."""
+        info = self._info()
+        return {
+            cond: mne.EvokedArray(self.mean[cond], info, tmin=self.tmin, nave=n, comment=cond, verbose=False)
+            for cond, n in self.n.items()
+        }
+
+    def se_evokeds(self):
+        """Błąd standardowy średniej (sqrt(M2 / (n - 1) / n)) jako dict warunek -> Evoked."""
+        info = self._info()
+        out = {}
+        for cond, n in self.n.items():
+            se = np.sqrt(self.m2[cond] / max(n - 1, 1) / n)
+            out[cond] = mne.EvokedArray(se, info, tmin=self.tmin, nave=n, comment=f"SE {cond}", verbose=False)
+        return out
+
+    def save(self, path):
+        """Zapisuje stan do pliku .npz."""
+        conds = list(self.n)
+        np.savez(
+            path, conditions=np.array(conds, dtype=str), n=np.array([self.n[c] for c in conds], dtype=np.int64),
+            mean=np.array([self.mean[c] for c in conds]), m2=np.array([self.m2[c] for c in conds]),
+            ch_names=np.array(self.ch_names or [], dtype=str), ch_types=np.array(self.ch_types or [], dtype=str),
+            sfreq=np.float64(self.sfreq or 0.0), tmin=np.float64(self.tmin or 0.0),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Odczytuje akumulator zapisany przez save()."""
+        acc = cls()
+        with np.load(path) as f:
+            if len(f["ch_names"]):
+                acc._check_layout(f["ch_names"].tolist(), float(f["sfreq"]), float(f["tmin"]), f["ch_types"].tolist())
+            for i, cond in enumerate(f["conditions"].tolist()):
+                acc._combine(cond, int(f["n"][i]), f["mean"][i], f["m2"][i])
+        return acc
+
+
+def merge_accumulators(items):
+    """Łączy akumulatory (obiekty lub ścieżki .npz) kolejno, w stałej pamięci."""
+    total = EvokedAccumulator()
+    for item in items:
+        total.merge(item if isinstance(item, EvokedAccumulator) else EvokedAccumulator.load(item))
+    return total
@@ -8,10 +8,19 @@ from neo.core import Event
 from .constants import MONITOR_DELAY_SEC
 
 
-def load_smr_block(filename, verbose=True):
-    """Wczytuje plik .smr i zwraca block (Neo)."""
+def load_smr_block(filename, verbose=True, lazy=False):
+    """
+    Wczytuje plik .smr i zwraca block (Neo).
+
+    lazy=True: sygnały analogowe zostają jako AnalogSignalProxy — próbki są czytane
+    z dysku dopiero w block_to_raw (tylko wybrane kanały i okno czasowe).
+    Zdarzenia są małe, więc wczytuje się je od razu.
+    """
     reader = Spike2IO(filename=filename)
-    block = reader.read_block()
+    block = reader.read_block(lazy=lazy)
+    if lazy:
+        for seg in block.segments:
+            seg.events[:] = [event.load() for event in seg.events]
     if verbose:
         print("Dostępne sygnały:")
         for i, seg in enumerate(block.segments):
@@ -23,8 +32,26 @@ def load_smr_block(filename, verbose=True):
     return block
 
 
+def event_time_window(seg, padding=(1.0, 1.0)):
+    """
+    Okno czasowe (t_start, t_stop) w s obejmujące wszystkie zdarzenia segmentu:
+    od pierwszego zdarzenia − padding[0] do ostatniego + padding[1].
+    Zwraca None, jeśli segment nie ma zdarzeń.
+    """
+    times = [event.times.rescale(pq.s).magnitude for event in seg.events if len(event.times)]
+    if not times:
+        return None
+    t_first = min(float(t.min()) for t in times)
+    t_last = max(float(t.max()) for t in times)
+    return max(t_first - padding[0], 0.0), t_last + padding[1]
+
+
 def shift_events_42ms(block):
-    """Przesuwa czasy zdarzeń o MONITOR_DELAY_SEC w każdym segmencie."""
+    """
+    Przestarzałe — zamiast tego build_events(..., delay_sec=MONITOR_DELAY_SEC)
+    lub apply_monitor_delay na tablicy events (przesunięcie w próbkach, bez przebudowy Neo).
+    Przesuwa czasy zdarzeń o MONITOR_DELAY_SEC w każdym segmencie, przebudowując obiekty Neo.
+    """
     delay = MONITOR_DELAY_SEC * pq.s
     for seg in block.segments:
         new_events = []
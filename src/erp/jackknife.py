@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Jackknife amplitud i latencji ERP (pik, latencja frakcyjna piku i pola) z błędem standardowym."""
+
+import numpy as np
+import pandas as pd
+
+from .constants import PEAK_WINDOWS, JACKKNIFE_FRACTION
+from .selection import epochs_buffer
+from .peaks import CONDITION_LABELS, CHANNELS, window_bounds
+
+MEASURES = ["Amp_uV", "Lat_ms", "LatFrac_ms", "LatPole_ms", "Średnia_uV"]
+
+
+def _take(w, idx):
+    return np.take_along_axis(w, idx[..., None], axis=-1)[..., 0]
+
+
+def window_measures(data_uV, times_ms, peak_windows=None, fraction=JACKKNIFE_FRACTION):
+    """
+    Pomiary w oknach komponentów dla tablicy (..., czas) w µV: amplituda i latencja piku,
+    latencja frakcyjna piku (początek przebiegu osiągającego fraction × amplitudy piku przed pikiem),
+    latencja frakcyjna pola (czas, w którym pole po stronie biegunowości komponentu osiąga
+    fraction całości) i średnia amplituda. Latencje są ciągłe, nie na siatce próbek: pik
+    z paraboli przez trzy próbki wokół maksimum, przecięcie progu i pola interpolacją liniową
+    (pole skumulowane metodą trapezów) — bez tego SE jackknife jest zerowe albo skacze o całe próbki.
+    Zwraca dict komponent -> dict miara -> tablica.
+    """
+    times_ms = np.asarray(times_ms)
+    dt = times_ms[1] - times_ms[0] if len(times_ms) > 1 else 1.0
+    out = {}
+    for comp, (start, stop) in window_bounds(times_ms, peak_windows).items():
+        shape = data_uV.shape[:-1]
+        if stop <= start:
+            out[comp] = {m: np.full(shape, np.nan) for m in MEASURES}
+            continue
+        pol = 1.0 if comp.startswith("P") else -1.0
+        w = pol * data_uV[..., start:stop]
+        w_times = times_ms[start:stop]
+        n = w.shape[-1]
+        peak = w.argmax(axis=-1)
+        peak_val = _take(w, peak)
+        # pik: wierzchołek paraboli przez próbki peak-1, peak, peak+1 (na brzegu okna bez korekty)
+        inner = (peak > 0) & (peak < n - 1)
+        y0 = _take(w, np.clip(peak - 1, 0, n - 1))
+        y2 = _take(w, np.clip(peak + 1, 0, n - 1))
+        curv = y0 - 2 * peak_val + y2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shift = np.where(inner & (curv < 0), 0.5 * (y0 - y2) / curv, 0.0)
+        lat = w_times[peak] + np.clip(shift, -0.5, 0.5) * dt
+        # latencja frakcyjna piku: przecięcie progu między ostatnią próbką poniżej progu przed pikiem
+        # a następną (tylko dla piku o biegunowości komponentu — inaczej NaN)
+        signed = peak_val > 0
+        thr = fraction * peak_val
+        below = (w < thr[..., None]) & (np.arange(n) <= peak[..., None])
+        last_below = np.where(below.any(axis=-1), n - 1 - below[..., ::-1].argmax(axis=-1), -1)
+        lo = np.clip(last_below, 0, n - 1)
+        hi = np.clip(last_below + 1, 0, n - 1)
+        w_lo, w_hi = _take(w, lo), _take(w, hi)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frac = np.where(w_hi > w_lo, (thr - w_lo) / (w_hi - w_lo), 0.0)
+        lat_frac = np.where(last_below >= 0, w_times[lo] + np.clip(frac, 0, 1) * dt, w_times[0])
+        # latencja frakcyjna pola: pole skumulowane (trapezy) osiąga fraction całości
+        pos = np.clip(w, 0, None)
+        area = np.zeros(w.shape)
+        np.cumsum((pos[..., 1:] + pos[..., :-1]) * (dt / 2), axis=-1, out=area[..., 1:])
+        total = area[..., -1]
+        target = fraction * total
+        k = np.clip((area >= target[..., None]).argmax(axis=-1), 1, max(n - 1, 1))
+        a_lo, a_hi = _take(area, np.minimum(k - 1, n - 1)), _take(area, np.minimum(k, n - 1))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frac_a = np.where(a_hi > a_lo, (target - a_lo) / (a_hi - a_lo), 0.0)
+        lat_area = w_times[np.minimum(k - 1, n - 1)] + np.clip(frac_a, 0, 1) * dt
+        out[comp] = {
+            "Amp_uV": pol * peak_val,
+            "Lat_ms": lat,
+            "LatFrac_ms": np.where(signed, lat_frac, np.nan),
+            "LatPole_ms": np.where(total > 0, lat_area, np.nan),
+            "Średnia_uV": pol * w.mean(axis=-1),
+        }
+    return out
+
+
+def jackknife_peaks(epochs, channels=None, peak_windows=None, fraction=JACKKNIFE_FRACTION, chunk=256):
+    """
+    Jackknife pomiarów window_measures dla każdego warunku, kanału i komponentu naraz.
+    Średnie leave-one-out liczone z sumy: (S − x_i) / (n − 1), porcjami po chunk prób — bez
+    n wywołań average(). Wartość = pomiar na średniej ze wszystkich prób; SE = sqrt((n−1)/n · Σ(θ_i − θ̄)²).
+    epochs: mne.Epochs lub MaskedEpochs (tylko zachowane próby). Zwraca DataFrame:
+    Warunek, Kanał, Komponent, n oraz dla każdej miary kolumny <miara> i <miara>_SE.
+    """
+    if channels is None:
+        channels = CHANNELS
+    if peak_windows is None:
+        peak_windows = PEAK_WINDOWS
+    data, keep, base = epochs_buffer(epochs)
+    ch_idx = [base.ch_names.index(ch) for ch in channels]
+    times_ms = base.times * 1000
+    codes = base.events[:, 2]
+    rows = []
+    for cond_name, cond_label in CONDITION_LABELS:
+        if cond_name not in base.event_id:
+            continue
+        idx = np.flatnonzero(keep & (codes == base.event_id[cond_name]))
+        n = len(idx)
+        if n < 2:
+            continue
+        total = np.zeros((len(channels), len(times_ms)))
+        for start in range(0, n, chunk):
+            total += (data[np.ix_(idx[start:start + chunk], ch_idx)] * 1e6).sum(axis=0)
+        full = window_measures(total / n, times_ms, peak_windows, fraction)
+        loo = {comp: {m: np.empty((n, len(channels))) for m in MEASURES} for comp in peak_windows}
+        for start in range(0, n, chunk):
+            sl = slice(start, start + chunk)
+            x = data[np.ix_(idx[sl], ch_idx)] * 1e6
+            part = window_measures((total - x) / (n - 1), times_ms, peak_windows, fraction)
+            for comp in peak_windows:
+                for m in MEASURES:
+                    loo[comp][m][sl] = part[comp][m]
+        for c, ch in enumerate(channels):
+            for comp in peak_windows:
+                row = {"Warunek": cond_label, "Kanał": ch, "Komponent": comp, "n": n}
+                for m in MEASURES:
+                    theta = loo[comp][m][:, c]
+                    row[m] = full[comp][m][c]
+                    row[f"{m}_SE"] = np.sqrt((n - 1) / n * np.sum((theta - theta.mean()) ** 2))
+                rows.append(row)
+    return pd.DataFrame(rows)
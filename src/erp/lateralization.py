@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Fale zlateralizowane: ipsi, contra i contra − ipsi dla par homologicznych 10-20."""
+
+import numpy as np
+import pandas as pd
+import mne
+
+from .constants import HOMOLOGOUS_PAIRS
+
+CUE_SIDES = ("left", "right")
+
+
+def _cue_side(condition):
+    side = condition.split("_", 1)[0]
+    return side if side in CUE_SIDES else None
+
+
+def lateralized_waves(evoked_dict, pairs=None, conditions=None):
+    """
+    Fale ipsi/contra dla wszystkich warunków i par jedną operacją indeksowania (bez kopii Evoked).
+    Ipsi = kanał po stronie wskazówki (left_* -> lewa półkula), contra = po przeciwnej.
+    Pary z brakującym kanałem są pomijane. Zwraca dict: conditions, pairs, times oraz
+    ipsi, contra, diff (contra − ipsi) — tablice (warunki × pary × czas) w V.
+    """
+    if pairs is None:
+        pairs = HOMOLOGOUS_PAIRS
+    if conditions is None:
+        conditions = [c for c in evoked_dict if _cue_side(c)]
+    first = evoked_dict[conditions[0]]
+    ch_names = first.ch_names
+    for c in conditions[1:]:
+        if evoked_dict[c].ch_names != ch_names:
+            raise ValueError(f"Inne kanały w warunku {c}")
+    pos = {ch: i for i, ch in enumerate(ch_names)}
+    pairs = [(l, r) for l, r in pairs if l in pos and r in pos]
+    data = np.stack([evoked_dict[c].data for c in conditions])
+    left = np.array([pos[l] for l, _ in pairs], dtype=int)
+    right = np.array([pos[r] for _, r in pairs], dtype=int)
+    is_left = np.array([_cue_side(c) == "left" for c in conditions])[:, None]
+    ipsi_idx = np.where(is_left, left, right)
+    contra_idx = np.where(is_left, right, left)
+    rows = np.arange(len(conditions))[:, None]
+    ipsi = data[rows, ipsi_idx]
+    contra = data[rows, contra_idx]
+    return {
+        "conditions": list(conditions), "pairs": pairs, "times": first.times,
+        "ipsi": ipsi, "contra": contra, "diff": contra - ipsi,
+    }
+
+
+def lateralized_evokeds(lat, kind="diff"):
+    """
+    Fale z lateralized_waves jako dict warunek -> Evoked o kanałach "L/R" (np. "O1/O2"),
+    do użycia w find_peaks_simple / find_peaks_validated. kind: "ipsi", "contra" lub "diff".
+    """
+    times = lat["times"]
+    info = mne.create_info([f"{l}/{r}" for l, r in lat["pairs"]], 1.0 / (times[1] - times[0]), "eeg")
+    return {
+        c: mne.EvokedArray(lat[kind][i], info, tmin=times[0], comment=f"{c} {kind}", verbose=False)
+        for i, c in enumerate(lat["conditions"])
+    }
+
+
+def lateralized_table(lat):
+    """Fale w formacie długim (µV): Warunek, Para, Czas_ms, Ipsi_uV, Contra_uV, Contra_minus_ipsi_uV."""
+    n_cond, n_pairs, n_times = lat["ipsi"].shape
+    return pd.DataFrame({
+        "Warunek": np.repeat(lat["conditions"], n_pairs * n_times),
+        "Para": np.tile(np.repeat([f"{l}/{r}" for l, r in lat["pairs"]], n_times), n_cond),
+        "Czas_ms": np.tile(lat["times"] * 1000, n_cond * n_pairs),
+        "Ipsi_uV": lat["ipsi"].ravel() * 1e6,
+        "Contra_uV": lat["contra"].ravel() * 1e6,
+        "Contra_minus_ipsi_uV": lat["diff"].ravel() * 1e6,
+    })
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Wykrywanie artefaktów ocznych na bieżąco (epoka po epoce) z estymatorem kwantyla P²."""
+
+import numpy as np
+
+from .constants import KANALY_OCZNE, OCULAR_PERCENTILE, OCULAR_THRESHOLD_LIMITS
+from .artifacts import ocular_max_ptp
+
+
+class P2Quantile:
+    """
+    Strumieniowy estymator kwantyla p (algorytm P², Jain & Chlamtac 1985):
+    5 znaczników, stała pamięć, O(1) na obserwację.
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self._q = []
+        self._n = np.arange(1, 6, dtype=float)
+        self._np = np.array([1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5], dtype=float)
+        self._dn = np.array([0, p / 2, p, (1 + p) / 2, 1], dtype=float)
+
+    def update(self, x):
+        self.count += 1
+        q = self._q
+        if self.count <= 5:
+            q.append(float(x))
+            q.sort()
+            return
+        n = self._n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = int(np.searchsorted(q, x, side="right")) - 1
+        n[k + 1:] += 1
+        self._np += self._dn
+        for i in (1, 2, 3):
+            d = self._np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1.0 if d > 0 else -1.0
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < qp < q[i + 1]:
+                    j = i + int(d)
+                    qp = q[i] + d * (q[j] - q[i]) / (n[j] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    @property
+    def value(self):
+        if self.count == 0:
+            return np.nan
+        if self.count <= 5:
+            return float(np.percentile(self._q, 100 * self.p))
+        return self._q[2]
+
+
+class OnlineOcularDetector:
+    """
+    Reguła z get_ocular_bad_epochs stosowana na bieżąco: dla każdej nowej epoki maks. PtP
+    (wygładzone, kanały oczne, okno artefaktów) porównywane jest z progiem
+    clip(kwantyl OCULAR_PERCENTILE, OCULAR_THRESHOLD_LIMITS), gdzie kwantyl szacuje P².
+    Do zebrania `warmup` epok obowiązuje górna granica progu.
+    Domyślnie pamięć jest stała (znaczniki P² i liczniki), niezależnie od długości sesji.
+    exact=True zapamiętuje maks. PtP i decyzję każdej epoki (jedna liczba na epokę) — wtedy
+    dostępne są online_decisions() i finalize() z decyzjami identycznymi z wersją wsadową.
+    """
+
+    def __init__(self, ch_names, times, smooth_window=8, percentile=OCULAR_PERCENTILE,
+                 limits=OCULAR_THRESHOLD_LIMITS, warmup=20, exact=False):
+        self.idx_ocular = [list(ch_names).index(ch) for ch in KANALY_OCZNE if ch in ch_names]
+        self.times = np.asarray(times)
+        self.smooth_window = smooth_window
+        self.percentile = percentile
+        self.limits = limits
+        self.warmup = warmup
+        self.exact = exact
+        self.n_epochs = 0
+        self.n_rejected = 0
+        self._quantile = P2Quantile(percentile / 100)
+        self._values = [] if exact else None
+        self._decisions = [] if exact else None
+
+    @property
+    def threshold(self):
+        """Bieżący próg (V)."""
+        if self.n_epochs < self.warmup:
+            return self.limits[1]
+        return float(np.clip(self._quantile.value, *self.limits))
+
+    def update(self, data):
+        """
+        Przyjmuje epokę (kanały × czas) lub paczkę (epoki × kanały × czas).
+        Zwraca tablicę bool: True = epoka odrzucona (decyzja natychmiastowa).
+        """
+        data = np.asarray(data)
+        if data.ndim == 2:
+            data = data[np.newaxis]
+        values = ocular_max_ptp(data, self.idx_ocular, self.times, smooth_window=self.smooth_window)
+        reject = np.empty(len(values), dtype=bool)
+        for i, v in enumerate(values):
+            self._quantile.update(v)
+            self.n_epochs += 1
+            reject[i] = v > self.threshold
+        self.n_rejected += int(reject.sum())
+        if self.exact:
+            self._values.extend(values.tolist())
+            self._decisions.extend(reject.tolist())
+        return reject
+
+    def _require_exact(self, name):
+        if not self.exact:
+            raise ValueError(f"{name}() wymaga OnlineOcularDetector(..., exact=True)")
+
+    def online_decisions(self):
+        """Decyzje podjęte na bieżąco (bool na epokę); wymaga exact=True."""
+        self._require_exact("online_decisions")
+        return np.array(self._decisions, dtype=bool)
+
+    def finalize(self, verbose=True):
+        """
+        Decyzje końcowe jak w get_ocular_bad_epochs (dokładny percentyl całej sesji); wymaga exact=True.
+        Zwraca (bad_idx, threshold, max_ptp_ocular).
+        """
+        self._require_exact("finalize")
+        max_ptp_ocular = np.array(self._values)
+        threshold = np.clip(np.percentile(max_ptp_ocular, self.percentile), *self.limits)
+        bad_idx = np.where(max_ptp_ocular > threshold)[0]
+        if verbose:
+            changed = int(np.sum(self.online_decisions() != (max_ptp_ocular > threshold)))
+            print(f"Próg końcowy: {threshold*1e6:.1f} µV (szacowany na bieżąco: {self.threshold*1e6:.1f} µV)")
+            print(f"Epok do odrzucenia: {len(bad_idx)}; zmienione decyzje względem bieżących: {changed}")
+        return bad_idx, threshold, max_ptp_ocular
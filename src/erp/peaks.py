@@ -4,8 +4,10 @@
 import numpy as np
 import pandas as pd
 import mne
+from scipy import signal
 
-from .constants import PEAK_WINDOWS
+from .constants import PEAK_WINDOWS, VALIDATED_PEAK_PARAMS
+from .selection import epochs_buffer
 
 CONDITION_LABELS = [
     ("left_valid", "Lewo Poprawne"),
@@ -16,40 +18,80 @@ CONDITION_LABELS = [
 CHANNELS = ["O1", "O2", "P3", "P4", "C3", "C4"]
 
 
+def window_bounds(times_ms, peak_windows=None):
+    """Granice okien pików w próbkach (searchsorted, raz dla wszystkich): dict komponent -> (start, stop)."""
+    if peak_windows is None:
+        peak_windows = PEAK_WINDOWS
+    times_ms = np.asarray(times_ms)
+    return {
+        comp: (int(np.searchsorted(times_ms, tmin, side="left")), int(np.searchsorted(times_ms, tmax, side="right")))
+        for comp, (tmin, tmax) in peak_windows.items()
+    }
+
+
+def window_peaks(data_uV, times_ms, peak_windows=None):
+    """
+    Piki we wszystkich oknach dla tablicy (..., czas) — np. (badani × warunki × kanały × czas):
+    maksimum dla komponentów P*, minimum dla N*, jedno argmax/argmin na okno dla całej tablicy.
+    Zwraca dict komponent -> (amplituda, latencja_ms) o kształcie data_uV.shape[:-1]; puste okno
+    lub przebieg NaN (warunek bez prób) -> NaN.
+    """
+    times_ms = np.asarray(times_ms)
+    out = {}
+    for comp, (start, stop) in window_bounds(times_ms, peak_windows).items():
+        if stop <= start:
+            nan = np.full(data_uV.shape[:-1], np.nan)
+            out[comp] = (nan, nan.copy())
+            continue
+        window = data_uV[..., start:stop]
+        idx = window.argmax(axis=-1) if comp.startswith("P") else window.argmin(axis=-1)
+        amp = np.take_along_axis(window, idx[..., None], axis=-1)[..., 0]
+        out[comp] = (amp, np.where(np.isnan(amp), np.nan, times_ms[start + idx]))
+    return out
+
+
+def _stack_conditions(evoked_dict, channels):
+    """Dane warunków CONDITION_LABELS dla kanałów jako (warunki × kanały × czas) w µV oraz czasy w ms."""
+    first = evoked_dict[CONDITION_LABELS[0][0]]
+    missing = [ch for ch in channels if ch not in first.ch_names]
+    if missing:
+        raise ValueError(f"Brak kanałów w evoked: {missing}")
+    data = []
+    for cond_name, _ in CONDITION_LABELS:
+        evoked = evoked_dict[cond_name]
+        if not np.array_equal(evoked.times, first.times):
+            raise ValueError(f"Inna oś czasu w warunku {cond_name}")
+        data.append(evoked.data[[evoked.ch_names.index(ch) for ch in channels]])
+    return np.stack(data) * 1e6, first.times * 1000
+
+
+def _peaks_frame(peaks, channels, peak_windows, subjects=None):
+    """Tabela pików (kolejność: badany, warunek, kanał) z wyniku window_peaks."""
+    n_cond, n_ch = len(CONDITION_LABELS), len(channels)
+    n_rows = n_cond * n_ch * (len(subjects) if subjects is not None else 1)
+    cols = {}
+    if subjects is not None:
+        cols["Badany"] = np.repeat(subjects, n_cond * n_ch)
+    cols["Warunek"] = np.tile(np.repeat([label for _, label in CONDITION_LABELS], n_ch), n_rows // (n_cond * n_ch))
+    cols["Kanał"] = np.tile(channels, n_rows // n_ch)
+    for comp in peak_windows:
+        amp, lat = peaks[comp]
+        cols[f"{comp}_Amp_uV"] = np.round(amp.ravel(), 2)
+        cols[f"{comp}_Lat_ms"] = np.round(lat.ravel(), 1)
+    return pd.DataFrame(cols)
+
+
 def find_peaks_simple(evoked_dict, channels=None, peak_windows=None, verbose=True):
-    """Proste wyszukiwanie pików w oknach. Zwraca DataFrame z kolumnami Warunek, Kanał, *_Amp_uV, *_Lat_ms."""
+    """
+    Proste wyszukiwanie pików w oknach. Zwraca DataFrame z kolumnami Warunek, Kanał, *_Amp_uV, *_Lat_ms.
+    Wszystkie warunki i kanały naraz (window_peaks na tablicy warunki × kanały × czas).
+    """
     if channels is None:
         channels = CHANNELS
     if peak_windows is None:
         peak_windows = PEAK_WINDOWS
-    results = []
-    for cond_name, cond_label in CONDITION_LABELS:
-        evoked = evoked_dict[cond_name]
-        for ch in channels:
-            try:
-                ch_idx = evoked.ch_names.index(ch)
-                data_uV = evoked.data[ch_idx, :] * 1e6
-            except Exception:
-                data_uV = evoked.copy().pick(ch).get_data(units="uV")[0, 0]
-            times = evoked.times
-            times_ms = times * 1000
-            row = {"Warunek": cond_label, "Kanał": ch}
-            for comp_name, (tmin, tmax) in peak_windows.items():
-                mask = (times_ms >= tmin) & (times_ms <= tmax)
-                if not np.any(mask):
-                    row[f"{comp_name}_Amp_uV"] = np.nan
-                    row[f"{comp_name}_Lat_ms"] = np.nan
-                    continue
-                w_data = data_uV[mask]
-                w_times = times_ms[mask]
-                if comp_name.startswith("P"):
-                    peak_idx = np.argmax(w_data)
-                else:
-                    peak_idx = np.argmin(w_data)
-                row[f"{comp_name}_Amp_uV"] = np.round(w_data[peak_idx], 2)
-                row[f"{comp_name}_Lat_ms"] = np.round(w_times[peak_idx], 1)
-            results.append(row)
-    df = pd.DataFrame(results)
+    data_uV, times_ms = _stack_conditions(evoked_dict, channels)
+    df = _peaks_frame(window_peaks(data_uV, times_ms, peak_windows), list(channels), peak_windows)
     if verbose:
         col_order = ["Warunek", "Kanał"] + [c for comp in peak_windows for c in [f"{comp}_Amp_uV", f"{comp}_Lat_ms"]]
         print("\n" + "="*100)
@@ -60,61 +102,92 @@ def find_peaks_simple(evoked_dict, channels=None, peak_windows=None, verbose=Tru
     return df
 
 
-def find_peaks_validated(evoked_dict, channels=None, verbose=True):
-    """Wyszukiwanie pików z weryfikacją sekwencji P1->N1->P3. Zwraca DataFrame."""
+def find_peaks_cohort(subject_evokeds, channels=None, peak_windows=None, validated=False):
+    """
+    find_peaks_simple (lub find_peaks_validated, gdy validated=True) dla wielu badanych jednym
+    przebiegiem: subject_evokeds to dict badany -> dict compute_evokeds.
+    Zwraca DataFrame z kolumną Badany (kolejność jak w dict).
+    """
     if channels is None:
         channels = CHANNELS
+    if peak_windows is None:
+        peak_windows = PEAK_WINDOWS
+    subjects = list(subject_evokeds)
+    stacked = [_stack_conditions(subject_evokeds[s], channels) for s in subjects]
+    times_ms = stacked[0][1]
+    if any(not np.array_equal(t, times_ms) for _, t in stacked):
+        raise ValueError("Badani mają różne osie czasu")
+    data_uV = np.stack([d for d, _ in stacked])
+    if validated:
+        peaks, comps = validated_peaks(data_uV, times_ms), ["N70", "P1", "N1", "P3"]
+    else:
+        peaks, comps = window_peaks(data_uV, times_ms, peak_windows), list(peak_windows)
+    return _peaks_frame(peaks, list(channels), comps, subjects=subjects)
 
-    def _find_peaks_validated(data_uV, times_ms):
-        out = {}
-        mask_p1 = (times_ms >= 90) & (times_ms <= 130)
-        if np.any(mask_p1):
-            p1_data, p1_times = data_uV[mask_p1], times_ms[mask_p1]
-            p1_idx = np.argmax(p1_data)
-            p1_amp, p1_lat = p1_data[p1_idx], p1_times[p1_idx]
-            out["P1"] = (p1_amp, p1_lat)
-            mask_n1 = (times_ms >= p1_lat + 20) & (times_ms <= 200)
-            if np.any(mask_n1):
-                n1_data, n1_times = data_uV[mask_n1], times_ms[mask_n1]
-                n1_idx = np.argmin(n1_data)
-                n1_amp, n1_lat = n1_data[n1_idx], n1_times[n1_idx]
-                out["N1"] = (n1_amp, n1_lat)
-                mask_p3 = (times_ms >= n1_lat + 50) & (times_ms <= 600)
-                if np.any(mask_p3):
-                    p3_data, p3_times = data_uV[mask_p3], times_ms[mask_p3]
-                    p3_idx = np.argmax(p3_data)
-                    p3_amp, p3_lat = p3_data[p3_idx], p3_times[p3_idx]
-                    if p1_lat < n1_lat < p3_lat and abs(p3_amp) >= abs(n1_amp) * 0.7:
-                        out["P3"] = (p3_amp, p3_lat)
-        mask_n70 = (times_ms >= 50) & (times_ms <= 90)
-        if np.any(mask_n70):
-            n70_data, n70_times = data_uV[mask_n70], times_ms[mask_n70]
-            n70_idx = np.argmin(n70_data)
-            out["N70"] = (n70_data[n70_idx], n70_times[n70_idx])
-        return out
-
-    results = []
-    for cond_name, cond_label in CONDITION_LABELS:
-        evoked = evoked_dict[cond_name]
-        for ch in channels:
-            try:
-                ch_idx = evoked.ch_names.index(ch)
-                data_uV = evoked.data[ch_idx, :] * 1e6
-            except Exception:
-                data_uV = evoked.copy().pick(ch).get_data(units="uV")[0, 0]
-            times_ms = evoked.times * 1000
-            peaks = _find_peaks_validated(data_uV, times_ms)
-            row = {"Warunek": cond_label, "Kanał": ch}
-            for comp in ["N70", "P1", "N1", "P3"]:
-                if comp in peaks:
-                    amp, lat = peaks[comp]
-                    row[f"{comp}_Amp_uV"] = np.round(amp, 2)
-                    row[f"{comp}_Lat_ms"] = np.round(lat, 1)
-                else:
-                    row[f"{comp}_Amp_uV"] = np.nan
-                    row[f"{comp}_Lat_ms"] = np.nan
-            results.append(row)
-    df = pd.DataFrame(results)
+
+def _masked_extreme(data_uV, times_ms, lo, hi, find_max):
+    """
+    Ekstremum w oknach [lo, hi] (ms) różnych dla każdego wiersza: maska (wiersze × czas), jedno argmax/argmin.
+    Zwraca (amplituda, latencja, czy_okno_niepuste); dla pustych okien NaN.
+    """
+    mask = (times_ms >= lo[:, None]) & (times_ms <= hi[:, None])
+    found = mask.any(axis=1)
+    if find_max:
+        idx = np.where(mask, data_uV, -np.inf).argmax(axis=1)
+    else:
+        idx = np.where(mask, data_uV, np.inf).argmin(axis=1)
+    amp = np.where(found, data_uV[np.arange(len(idx)), idx], np.nan)
+    lat = np.where(found, times_ms[idx], np.nan)
+    return amp, lat, found
+
+
+def validated_peaks(data_uV, times_ms, params=None, chunk=4096):
+    """
+    Piki N70, P1, N1, P3 z weryfikacją sekwencji P1 -> N1 -> P3 dla tablicy (..., czas) naraz.
+    Okno N1 zależy od latencji P1, a okno P3 od latencji N1 — maski dynamiczne per wiersz
+    (porcjami po chunk wierszy). Reguła akceptacji P3 i przesunięcia okien: VALIDATED_PEAK_PARAMS.
+    Zwraca dict komponent -> (amplituda, latencja_ms) o kształcie data_uV.shape[:-1]; brak piku -> NaN.
+    """
+    if params is None:
+        params = VALIDATED_PEAK_PARAMS
+    times_ms = np.asarray(times_ms)
+    shape = data_uV.shape[:-1]
+    rows = data_uV.reshape(-1, data_uV.shape[-1])
+    comps = ["N70", "P1", "N1", "P3"]
+    out = {c: (np.full(len(rows), np.nan), np.full(len(rows), np.nan)) for c in comps}
+    static = window_peaks(rows, times_ms, {"N70": params["n70_window"], "P1": params["p1_window"]})
+    for c in ["N70", "P1"]:
+        out[c] = static[c]
+    p1_amp, p1_lat = static["P1"]
+    for start in range(0, len(rows), chunk):
+        sl = slice(start, min(start + chunk, len(rows)))
+        data, p1 = rows[sl], p1_lat[sl]
+        has_p1 = ~np.isnan(p1)
+        n1_amp, n1_lat, has_n1 = _masked_extreme(
+            data, times_ms, p1 + params["n1_offset"], np.full(len(p1), params["n1_end"], dtype=float), find_max=False,
+        )
+        has_n1 &= has_p1
+        p3_amp, p3_lat, has_p3 = _masked_extreme(
+            data, times_ms, n1_lat + params["p3_offset"], np.full(len(p1), params["p3_end"], dtype=float), find_max=True,
+        )
+        with np.errstate(invalid="ignore"):
+            accept = has_n1 & has_p3 & (p1 < n1_lat) & (n1_lat < p3_lat) & (np.abs(p3_amp) >= np.abs(n1_amp) * params["p3_min_ratio"])
+        out["N1"][0][sl] = np.where(has_n1, n1_amp, np.nan)
+        out["N1"][1][sl] = np.where(has_n1, n1_lat, np.nan)
+        out["P3"][0][sl] = np.where(accept, p3_amp, np.nan)
+        out["P3"][1][sl] = np.where(accept, p3_lat, np.nan)
+    return {c: (amp.reshape(shape), lat.reshape(shape)) for c, (amp, lat) in out.items()}
+
+
+def find_peaks_validated(evoked_dict, channels=None, verbose=True, params=None):
+    """
+    Wyszukiwanie pików z weryfikacją sekwencji P1->N1->P3. Zwraca DataFrame.
+    Wszystkie warunki i kanały naraz (validated_peaks); okna i próg akceptacji w params.
+    """
+    if channels is None:
+        channels = CHANNELS
+    data_uV, times_ms = _stack_conditions(evoked_dict, channels)
+    df = _peaks_frame(validated_peaks(data_uV, times_ms, params), list(channels), ["N70", "P1", "N1", "P3"])
     if verbose:
         col_order = ["Warunek", "Kanał", "N70_Amp_uV", "N70_Lat_ms", "P1_Amp_uV", "P1_Lat_ms", "N1_Amp_uV", "N1_Lat_ms", "P3_Amp_uV", "P3_Lat_ms"]
         print("\n" + "="*100)
@@ -125,6 +198,55 @@ def find_peaks_validated(evoked_dict, channels=None, verbose=True):
     return df
 
 
+def single_trial_peaks(epochs, channels=None, peak_windows=None, lowpass=None, chunk=256):
+    """
+    Pomiary PEAK_WINDOWS dla każdej próby i kanału: amplituda i latencja piku oraz średnia amplituda okna.
+    Jeden przebieg po tablicy epok porcjami po chunk epok (ograniczona pamięć); lowpass (Hz) —
+    opcjonalne wygładzenie filtrem Butterwortha bez przesunięcia fazy przed pomiarem.
+    epochs: mne.Epochs lub MaskedEpochs (tylko zachowane próby). Zwraca DataFrame w formacie długim:
+    Próba (pierwotny indeks zdarzenia, jak WRONG_ANS), Warunek, Kanał, Komponent, Amp_uV, Lat_ms, Średnia_uV.
+    """
+    if channels is None:
+        channels = CHANNELS
+    if peak_windows is None:
+        peak_windows = PEAK_WINDOWS
+    data, keep, base = epochs_buffer(epochs)
+    rows = np.flatnonzero(keep)
+    ch_idx = [base.ch_names.index(ch) for ch in channels]
+    times_ms = base.times * 1000
+    bounds = window_bounds(times_ms, peak_windows)
+    sos = None
+    if lowpass is not None:
+        sos = signal.butter(4, lowpass, btype="lowpass", fs=base.info["sfreq"], output="sos")
+    comps = list(peak_windows)
+    shape = (len(rows), len(channels), len(comps))
+    amp, lat, mean = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+    for start in range(0, len(rows), chunk):
+        sl = slice(start, start + chunk)
+        x = data[np.ix_(rows[sl], ch_idx)] * 1e6
+        if sos is not None:
+            x = signal.sosfiltfilt(sos, x, axis=-1)
+        peaks = window_peaks(x, times_ms, peak_windows)
+        for k, comp in enumerate(comps):
+            amp[sl, :, k], lat[sl, :, k] = peaks[comp]
+            w_start, w_stop = bounds[comp]
+            if w_stop > w_start:
+                mean[sl, :, k] = x[..., w_start:w_stop].mean(axis=-1)
+    labels = dict(CONDITION_LABELS)
+    names = {code: labels.get(name, name) for name, code in base.event_id.items()}
+    conds = np.array([names.get(code, str(code)) for code in base.events[rows, 2]], dtype=object)
+    n_inner = len(channels) * len(comps)
+    return pd.DataFrame({
+        "Próba": np.repeat(np.asarray(base.selection)[rows], n_inner),
+        "Warunek": np.repeat(conds, n_inner),
+        "Kanał": np.tile(np.repeat(channels, len(comps)), len(rows)),
+        "Komponent": np.tile(comps, len(rows) * len(channels)),
+        "Amp_uV": amp.ravel(),
+        "Lat_ms": lat.ravel(),
+        "Średnia_uV": mean.ravel(),
+    })
+
+
 def save_peak_tables(df_simple, df_validated, output_dir="results", path_simple="ERP_peak_analysis_single_subject.csv", path_validated="ERP_peaks_validated.csv"):
     """Zapisuje DataFrame pików do CSV w output_dir."""
     import os
@@ -1,34 +1,115 @@
 # -*- coding: utf-8 -*-
 """Konwersja bloku Neo na MNE Raw."""
 
+import tracemalloc
+
 import numpy as np
+import quantities as pq
 import mne
+from neo.io.proxyobjects import AnalogSignalProxy
 
 from .constants import CH_NAMES_10_20
 
 
-def block_to_raw(block, ch_names=None, verbose=True):
+def _select_signal(signal, ch_idx=None, time_slice=None):
+    """
+    Wycina z sygnału Neo okno czasowe (s) i — dla AnalogSignalProxy — wybrane kanały;
+    proxy czyta z dysku tylko ten fragment. Sygnał w pamięci jest cięty w czasie bez kopii,
+    a kanały zostają do skopiowania w block_to_raw. Zwraca (signal, ch_idx do wybrania lub None).
+    """
+    if time_slice is not None:
+        time_slice = tuple(None if t is None else t * pq.s for t in time_slice)
+    if isinstance(signal, AnalogSignalProxy):
+        return signal.load(time_slice=time_slice, channel_indexes=ch_idx, strict_slicing=False), None
+    if time_slice is not None:
+        # indeksy próbek jak w AnalogSignal.time_slice, ale wycinek signal[i0:i1] to widok (bez kopii)
+        sr = float(signal.sampling_rate.rescale(pq.Hz))
+        t0 = float(signal.t_start.rescale(pq.s))
+        n = signal.shape[0]
+        i0 = 0 if time_slice[0] is None else min(max(int(round((float(time_slice[0]) - t0) * sr)), 0), n)
+        i1 = n if time_slice[1] is None else min(max(int(round((float(time_slice[1]) - t0) * sr)), i0), n)
+        signal = signal[i0:i1]
+    return signal, ch_idx
+
+
+def _volts_factor(signal):
+    """Mnożnik jednostek sygnału Neo -> V (z metadanych quantities); None, jeśli to nie napięcie."""
+    try:
+        return float(pq.Quantity(1.0, signal.units).rescale(pq.V).magnitude)
+    except ValueError:
+        return None
+
+
+def block_to_raw(block, ch_names=None, verbose=True, channels=None, time_slice=None,
+                 to_volts=False, dtype=np.float64, report_memory=False):
     """
     Z segmentu 0 bloku Neo wyciąga sygnał EEG (kanały × czas),
     tworzy MNE Raw. Zwraca (raw, eeg_data, sfreq).
+
+    channels: podzbiór nazw z ch_names do wczytania (np. bez F8).
+    time_slice: (t_start, t_stop) w s, np. z event_time_window; None = cały zapis.
+    Raw ma first_samp równe początkowi okna, więc próbki zdarzeń z build_events
+    pozostają poprawne. Przy bloku z load_smr_block(lazy=True) czytany jest tylko ten fragment.
+
+    Sygnał w pamięci (blok wczytany w całości) jest kopiowany raz — wybrane kanały i okno
+    trafiają wprost do tablicy (kanały × czas) typu dtype, którą Raw używa bez kolejnej kopii
+    (eeg_data to ten sam bufor). Przy AnalogSignalProxy Neo najpierw wczytuje wybrany fragment,
+    więc szczyt pamięci to ok. dwie kopie fragmentu. to_volts=True skaluje ją w miejscu do V
+    według jednostek Neo (np. µV), zamiast uv_to_v_if_needed. dtype=np.float32 zmniejsza
+    o połowę eeg_data, ale MNE przechowuje Raw w float64, więc Raw dostaje własną kopię.
+    report_memory=True wypisuje szczytowe zużycie pamięci (tracemalloc) podczas konwersji.
     """
     if ch_names is None:
         ch_names = CH_NAMES_10_20
+    ch_idx = None
+    if channels is not None:
+        ch_idx = [list(ch_names).index(ch) for ch in channels]
+        ch_names = list(channels)
+    started = report_memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    elif report_memory:
+        tracemalloc.reset_peak()
     seg = block.segments[0]
-    signal = seg.analogsignals[0]
-    eeg_data = signal.magnitude.T  # (n_channels, n_times)
+    signal, copy_idx = _select_signal(seg.analogsignals[0], ch_idx=ch_idx, time_slice=time_slice)
     sfreq = float(signal.sampling_rate)
+    first_samp = int(round(float(signal.t_start.rescale(pq.s)) * sfreq))
+    magnitude = signal.magnitude
+    if copy_idx is None:
+        eeg_data = np.empty((magnitude.shape[1], magnitude.shape[0]), dtype=dtype)  # (n_channels, n_times)
+        eeg_data[...] = magnitude.T
+    else:
+        # kanał po kanale z sygnału — bez pośredniej kopii signal[:, ch_idx]
+        eeg_data = np.empty((len(copy_idx), magnitude.shape[0]), dtype=dtype)
+        for row, c in enumerate(copy_idx):
+            eeg_data[row] = magnitude[:, c]
+    factor = _volts_factor(signal) if to_volts else None
+    if factor is not None and factor != 1.0:
+        eeg_data *= factor
     if verbose:
-        print(f"Kształt danych: {signal.shape}")
+        print(f"Kształt danych: {eeg_data.shape[::-1]}")
         print(f"Dane: {eeg_data.shape}")
         print(f"Częstotliwość: {sfreq} Hz")
         print(f"Kanały: {ch_names}")
+        if first_samp:
+            print(f"Początek okna: {first_samp / sfreq:.3f} s (próbka {first_samp})")
+        if to_volts:
+            if factor is None:
+                print(f"Jednostki {signal.units.dimensionality} nie są napięciem — bez skalowania")
+            else:
+                print(f"Jednostki: {signal.units.dimensionality} -> V (× {factor:g})")
+    del signal
     info = mne.create_info(
         ch_names=ch_names,
         sfreq=sfreq,
         ch_types=["eeg"] * len(ch_names),
     )
-    raw = mne.io.RawArray(eeg_data, info)
+    raw = mne.io.RawArray(eeg_data, info, first_samp=first_samp)
+    if report_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        if started:
+            tracemalloc.stop()
+        print(f"Pamięć: dane {eeg_data.nbytes / 1024**2:.1f} MB, szczyt konwersji {peak / 1024**2:.1f} MB")
     if verbose:
         print(raw.info)
     return raw, eeg_data, sfreq
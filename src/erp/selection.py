@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Odrzucanie epok przez maskę (bez kopii danych) z mapowaniem na pierwotne indeksy zdarzeń."""
+
+import numpy as np
+import mne
+
+from .constants import WRONG_ANS
+from .artifacts import epochs_data_view
+
+
+class MaskedEpochs:
+    """
+    Jeden bufor epok MNE + maska zachowanych prób. Odrzucenie tylko zmienia maskę;
+    średnie liczone są wprost z bufora (wagi × dane, bez kopii podzbiorów),
+    a mne.Epochs powstaje dopiero w to_epochs().
+    orig_idx: indeksy w pierwotnej tablicy zdarzeń (epochs.selection) — w tej numeracji
+    podawane są WRONG_ANS, niezależnie od epok usuniętych wcześniej przez MNE.
+    """
+
+    def __init__(self, epochs):
+        self.epochs = epochs
+        self.orig_idx = np.asarray(epochs.selection).copy()
+        self.keep = np.ones(len(self.orig_idx), dtype=bool)
+        self.reasons = {}
+
+    def __len__(self):
+        return int(self.keep.sum())
+
+    def __repr__(self):
+        return f"<MaskedEpochs | {len(self)}/{len(self.keep)} zachowanych>"
+
+    @property
+    def data(self):
+        """Wszystkie epoki (także odrzucone), widok tylko do odczytu."""
+        return epochs_data_view(self.epochs)
+
+    @property
+    def event_codes(self):
+        return self.epochs.events[:, 2]
+
+    @property
+    def event_id(self):
+        return self.epochs.event_id
+
+    def reject(self, idx, reason="REJECT"):
+        """Odrzuca epoki o pozycjach idx w buforze."""
+        for ix in np.atleast_1d(np.asarray(idx, dtype=int)):
+            self.keep[ix] = False
+            self.reasons.setdefault(int(ix), []).append(reason)
+        return self
+
+    def reject_original(self, orig_indices, reason="REJECT"):
+        """Odrzuca epoki wg pierwotnych indeksów zdarzeń (np. WRONG_ANS); brakujące są pomijane."""
+        return self.reject(np.flatnonzero(np.isin(self.orig_idx, orig_indices)), reason=reason)
+
+    def condition_mask(self, conditions):
+        """Maska zachowanych epok należących do warunku (lub listy warunków)."""
+        if isinstance(conditions, str):
+            conditions = [conditions]
+        codes = [self.event_id[c] for c in conditions]
+        return self.keep & np.isin(self.event_codes, codes)
+
+    def kept_indices(self):
+        return np.flatnonzero(self.keep)
+
+    def average(self, conditions):
+        """Evoked dla warunku (lub listy warunków) — średnia ważona bez kopii epok; bez prób -> NaN."""
+        if isinstance(conditions, str):
+            conditions = [conditions]
+        mask = self.condition_mask(conditions)
+        n = int(mask.sum())
+        weights = mask / max(n, 1)
+        mean = np.tensordot(weights, self.data, axes=(0, 0))
+        if n == 0:
+            mean[:] = np.nan
+        return mne.EvokedArray(
+            mean, self.epochs.info, tmin=self.epochs.tmin, comment=" + ".join(conditions),
+            nave=n, baseline=self.epochs.baseline, verbose=False,
+        )
+
+    def to_epochs(self):
+        """Materializuje mne.Epochs z zachowanych prób; przyczyny odrzucenia trafiają do drop_log."""
+        epochs = self.epochs[self.kept_indices()]
+        drop_log = list(self.epochs.drop_log)
+        for ix, why in self.reasons.items():
+            drop_log[self.orig_idx[ix]] = tuple(dict.fromkeys(why))
+        epochs.drop_log = tuple(drop_log)
+        return epochs
+
+
+def epochs_buffer(epochs):
+    """
+    Bufor prób dla mne.Epochs lub MaskedEpochs: (data, keep, base) — data (epoki × kanały × czas,
+    widok bez kopii), keep — maska zachowanych prób (bool; dla mne.Epochs same True),
+    base — mne.Epochs z info, events i selection odpowiadającymi wierszom data.
+    """
+    if isinstance(epochs, MaskedEpochs):
+        return epochs.data, epochs.keep, epochs.epochs
+    return epochs_data_view(epochs), np.ones(len(epochs), dtype=bool), epochs
+
+
+def mask_bad_epochs(epochs_temp, ocular_bad_idx, wrong_ans=None, verbose=True):
+    """
+    Odpowiednik drop_bad_epochs bez kopii: zwraca MaskedEpochs z odrzuconymi artefaktami
+    ocznymi (pozycje w epochs_temp) i błędnymi odpowiedziami (pierwotne indeksy zdarzeń).
+    """
+    if wrong_ans is None:
+        wrong_ans = WRONG_ANS
+    masked = MaskedEpochs(epochs_temp)
+    masked.reject(ocular_bad_idx, reason="OCULAR")
+    masked.reject_original(wrong_ans, reason="WRONG_ANS")
+    if verbose:
+        n_total = len(masked.keep)
+        n_keep = len(masked)
+        print(f"\nOdrzucanie (maska): {len(ocular_bad_idx)} artefakty oczne + {len(wrong_ans)} błędne odpowiedzi = {n_total - n_keep} epok łącznie")
+        print(f"Zaakceptowane:   {n_keep} ({n_keep/n_total*100:.1f}%)")
+        for k in ["left_valid", "left_invalid", "right_valid", "right_invalid"]:
+            if k in masked.event_id:
+                print(f"  {k}: {int(masked.condition_mask(k).sum())} prób")
+    return masked
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Testy wygładzania w detekcji artefaktów ocznych (src.erp.artifacts)."""
+
+import numpy as np
+import pytest
+
+from src.erp.artifacts import moving_average, ocular_max_ptp
+from src.erp.constants import TMIN_ARTEFAKT, TMAX_ARTEFAKT
+
+
+def _moving_average_reference(x, window):
+    """Pierwotna implementacja: np.convolve(mode="same") osobno dla każdego przebiegu."""
+    return np.apply_along_axis(lambda r: np.convolve(r, np.ones(window) / window, mode="same"), -1, x)
+
+
+@pytest.mark.parametrize("window", [1, 2, 3, 7, 8, 15])
+def test_moving_average_matches_convolve(window):
+    rng = np.random.default_rng(window)
+    # µV w V z dryfem stałym — jak sygnał oczny po korekcie linii bazowej lub bez niej
+    x = rng.standard_normal((40, 3, 161)) * 20e-6 + 1e-3
+    expected = _moving_average_reference(x, window)
+    np.testing.assert_allclose(moving_average(x, window), expected, rtol=1e-12, atol=1e-18)
+
+
+def test_moving_average_float32_input():
+    x = np.random.default_rng(0).standard_normal((5, 2, 100)).astype(np.float32)
+    out = moving_average(x, 8)
+    assert out.dtype == np.float64
+    np.testing.assert_allclose(out, _moving_average_reference(x.astype(np.float64), 8), rtol=1e-12, atol=1e-15)
+
+
+def test_ocular_max_ptp_matches_reference():
+    rng = np.random.default_rng(1)
+    times = np.arange(-80, 321) / 400.0
+    data = rng.standard_normal((30, 4, len(times))) * 30e-6
+    idx_ocular = [0, 2]
+    win = (times >= TMIN_ARTEFAKT) & (times <= TMAX_ARTEFAKT)
+    smoothed = _moving_average_reference(data[:, idx_ocular][:, :, win], 8)
+    expected = np.ptp(smoothed, axis=2).max(axis=1)
+    np.testing.assert_allclose(ocular_max_ptp(data, idx_ocular, times), expected, rtol=1e-12, atol=1e-18)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Testy średnich warunków z jednego przejścia (src.erp.erp.grouped_sums / grouped_average)."""
+
+import numpy as np
+import mne
+import pytest
+
+from src.erp.constants import EVENT_DICT
+from src.erp.erp import CONDITIONS, grouped_sums, grouped_average, compute_evokeds
+from src.erp.peaks import find_peaks_simple, find_peaks_validated
+
+SFREQ = 400.0
+CH_NAMES = ["O1", "O2", "P3", "P4", "C3", "C4"]
+
+
+def _epochs(n=90, seed=0, offset=1e-3):
+    """Epoki (-200..800 ms) z dużą składową stałą — M2 z sum kwadratów traciłoby wtedy precyzję."""
+    rng = np.random.default_rng(seed)
+    codes = rng.choice(list(EVENT_DICT.values()), size=n)
+    data = rng.standard_normal((n, len(CH_NAMES), 401)) * 5e-6 + offset
+    events = np.column_stack([np.arange(n) * 1000, np.zeros(n, int), codes])
+    info = mne.create_info(CH_NAMES, SFREQ, "eeg")
+    return mne.EpochsArray(data, info, events=events, event_id=EVENT_DICT, tmin=-0.2, baseline=None, verbose=False)
+
+
+@pytest.mark.parametrize("chunk", [7, 32, 256])
+def test_grouped_sums_m2_matches_var(chunk):
+    rng = np.random.default_rng(chunk)
+    data = rng.standard_normal((100, 3, 50)) * 20e-6 + 1e-3
+    codes = rng.integers(1, 5, size=100)
+    keep = rng.random(100) > 0.2
+    sums, m2, counts = grouped_sums(data, codes, [1, 2, 3, 4], keep=keep, chunk=chunk, return_m2=True)
+    for g, code in enumerate([1, 2, 3, 4]):
+        x = data[keep & (codes == code)]
+        assert counts[g] == len(x)
+        np.testing.assert_allclose(sums[g], x.sum(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(m2[g], np.var(x, axis=0) * len(x), rtol=1e-9)
+
+
+def test_grouped_sums_without_m2():
+    data = np.random.default_rng(0).standard_normal((20, 2, 10))
+    _, m2, _ = grouped_sums(data, np.arange(20) % 2, [0, 1])
+    assert m2 is None
+
+
+def test_grouped_average_se_matches_numpy():
+    epochs = _epochs()
+    ev, se = grouped_average(epochs, return_se=True)
+    data = epochs.get_data()
+    codes = epochs.events[:, 2]
+    for name in CONDITIONS + ["valid", "invalid"]:
+        members = [name] if name in CONDITIONS else [c for c in CONDITIONS if c.endswith("_" + name)]
+        x = data[np.isin(codes, [EVENT_DICT[c] for c in members])]
+        assert ev[name].nave == len(x)
+        np.testing.assert_allclose(ev[name].data, x.mean(axis=0), rtol=1e-12)
+        np.testing.assert_allclose(se[name].data, x.std(axis=0, ddof=1) / np.sqrt(len(x)), rtol=1e-8)
+
+
+def test_empty_condition_gives_nan_rows():
+    epochs = _epochs(seed=1, offset=0.0)
+    empty = "left_invalid"
+    epochs.drop(np.flatnonzero(epochs.events[:, 2] == EVENT_DICT[empty]), verbose=False)
+    evokeds, se = compute_evokeds(epochs, verbose=False, return_se=True)
+    assert evokeds[empty].nave == 0
+    assert np.isnan(evokeds[empty].data).all() and np.isnan(se[empty].data).all()
+    for df in (find_peaks_simple(evokeds, channels=CH_NAMES, verbose=False),
+               find_peaks_validated(evokeds, channels=CH_NAMES, verbose=False)):
+        values = df.drop(columns=["Warunek", "Kanał"])
+        assert values[df["Warunek"] == "Lewo Niepoprawne"].isna().all().all()
+        assert values[df["Warunek"] == "Lewo Poprawne"][["P1_Amp_uV", "P1_Lat_ms"]].notna().all().all()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Testy jackknife latencji i amplitud ERP (src.erp.jackknife)."""
+
+import numpy as np
+import mne
+import pytest
+
+from src.erp.constants import EVENT_DICT, PEAK_WINDOWS, JACKKNIFE_FRACTION
+from src.erp.jackknife import MEASURES, window_measures, jackknife_peaks
+from src.erp.peaks import CHANNELS, CONDITION_LABELS
+
+SFREQ = 500.0
+
+
+def _jittered_epochs(n_per_cond=24, seed=0):
+    """Epoki z P1/N1/P3 (gaussowskie) o latencji przesuniętej losowo w każdej próbie, 500 Hz."""
+    rng = np.random.default_rng(seed)
+    times = np.arange(-100, 401) / SFREQ
+    t_ms = times * 1000
+    codes = np.repeat(list(EVENT_DICT.values()), n_per_cond)
+    data = rng.standard_normal((len(codes), len(CHANNELS), len(times))) * 1e-6
+    for i in range(len(codes)):
+        for mu, sigma, amp in ((110, 10, 4), (165, 12, -5), (350, 60, 6)):
+            data[i] += amp * 1e-6 * np.exp(-0.5 * ((t_ms - mu - rng.normal(0, 6)) / sigma) ** 2)
+    events = np.column_stack([np.arange(len(codes)) * 1000, np.zeros(len(codes), int), codes])
+    info = mne.create_info(CHANNELS, SFREQ, "eeg")
+    return mne.EpochsArray(data, info, events=events, event_id=EVENT_DICT, tmin=times[0],
+                           baseline=None, verbose=False)
+
+
+def _brute_force_se(epochs, cond):
+    """SE jackknife z n jawnych średnich leave-one-out."""
+    x = epochs[cond].get_data(picks=CHANNELS) * 1e6
+    n = len(x)
+    theta = {comp: {m: [] for m in MEASURES} for comp in PEAK_WINDOWS}
+    for i in range(n):
+        loo = np.delete(x, i, axis=0).mean(axis=0)
+        res = window_measures(loo, epochs.times * 1000, PEAK_WINDOWS, JACKKNIFE_FRACTION)
+        for comp in PEAK_WINDOWS:
+            for m in MEASURES:
+                theta[comp][m].append(res[comp][m])
+    return {
+        (comp, m): np.sqrt((n - 1) / n * np.sum((np.array(v) - np.mean(v, axis=0)) ** 2, axis=0))
+        for comp, ms in theta.items() for m, v in ms.items()
+    }
+
+
+@pytest.fixture(scope="module")
+def epochs():
+    return _jittered_epochs()
+
+
+@pytest.fixture(scope="module")
+def table(epochs):
+    return jackknife_peaks(epochs)
+
+
+@pytest.mark.parametrize("cond_name,cond_label", CONDITION_LABELS[:2])
+def test_jackknife_matches_brute_force(epochs, table, cond_name, cond_label):
+    expected = _brute_force_se(epochs, cond_name)
+    rows = table[table["Warunek"] == cond_label]
+    for (comp, m), se in expected.items():
+        got = rows[rows["Komponent"] == comp].set_index("Kanał").loc[CHANNELS, f"{m}_SE"].to_numpy()
+        np.testing.assert_allclose(got, se, rtol=1e-6, atol=1e-9, err_msg=f"{comp} {m}")
+
+
+@pytest.mark.parametrize("measure", ["Lat_ms", "LatFrac_ms", "LatPole_ms"])
+def test_latency_se_nonzero_and_subsample(table, measure):
+    rows = table[table["Komponent"].isin(["P1", "N1", "P3"])]
+    se = rows[f"{measure}_SE"].to_numpy()
+    assert np.all(np.isfinite(se))
+    assert np.all(se > 0)
+    # latencje nie leżą na siatce próbek (2 ms)
+    lat = rows[measure].to_numpy()
+    assert np.any(np.abs(lat / (1000 / SFREQ) - np.round(lat / (1000 / SFREQ))) > 1e-6)
+
+
+def test_window_measures_gaussian_latencies():
+    t_ms = np.arange(-200, 800, 1000 / SFREQ)
+    mu, sigma = 110.3, 8.0
+    x = 5 * np.exp(-0.5 * ((t_ms - mu) / sigma) ** 2)
+    res = window_measures(x[None], t_ms, {"P1": (70, 150)}, fraction=0.5)["P1"]
+    assert res["Lat_ms"][0] == pytest.approx(mu, abs=0.05)
+    assert res["LatPole_ms"][0] == pytest.approx(mu, abs=0.05)
+    assert res["LatFrac_ms"][0] == pytest.approx(mu - sigma * np.sqrt(2 * np.log(2)), abs=0.1)
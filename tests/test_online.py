@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Testy wykrywania artefaktów ocznych na bieżąco (src.erp.online)."""
+
+import numpy as np
+import mne
+import pytest
+
+from src.erp.artifacts import get_ocular_bad_epochs
+from src.erp.constants import KANALY_OCZNE
+from src.erp.online import P2Quantile, OnlineOcularDetector
+
+
+@pytest.mark.parametrize("n", [1, 3, 5])
+def test_p2_quantile_exact_for_first_five(n):
+    x = np.random.default_rng(n).standard_normal(n)
+    q = P2Quantile(0.95)
+    for v in x:
+        q.update(v)
+    assert q.value == pytest.approx(np.percentile(x, 95))
+
+
+@pytest.mark.parametrize("p", [0.5, 0.9, 0.95])
+@pytest.mark.parametrize("dist", ["normal", "lognormal", "uniform"])
+def test_p2_quantile_close_to_percentile(p, dist):
+    rng = np.random.default_rng(42)
+    x = {"normal": rng.standard_normal, "lognormal": lambda n: rng.lognormal(0, 0.5, n),
+         "uniform": rng.random}[dist](20000)
+    q = P2Quantile(p)
+    for v in x:
+        q.update(v)
+    exact = np.percentile(x, 100 * p)
+    # P² jest przybliżony: błąd względem rozrzutu danych (IQR) na poziomie pojedynczych procent
+    iqr = np.subtract(*np.percentile(x, [75, 25]))
+    assert abs(q.value - exact) < 0.03 * iqr
+    assert q.count == len(x)
+
+
+def test_p2_quantile_empty():
+    assert np.isnan(P2Quantile(0.5).value)
+
+
+def _ocular_epochs(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    ch_names = KANALY_OCZNE + ["O1", "O2"]
+    data = rng.standard_normal((n, len(ch_names), 401)) * 8e-6
+    blinks = rng.random(n) < 0.1
+    data[blinks, :len(KANALY_OCZNE), 150:230] += 120e-6
+    info = mne.create_info(ch_names, 400.0, "eeg")
+    return mne.EpochsArray(data, info, tmin=-0.2, baseline=None, verbose=False)
+
+
+def test_online_detector_finalize_matches_batch():
+    epochs = _ocular_epochs()
+    data = epochs.get_data()
+    det = OnlineOcularDetector(epochs.ch_names, epochs.times, exact=True)
+    for start in range(0, len(data), 16):
+        det.update(data[start:start + 16])
+    bad_idx, threshold, max_ptp = det.finalize(verbose=False)
+    ref_bad, ref_threshold, _, _, _, ref_ptp, _ = get_ocular_bad_epochs(epochs, verbose=False)
+    np.testing.assert_array_equal(bad_idx, ref_bad)
+    assert threshold == pytest.approx(ref_threshold)
+    np.testing.assert_allclose(max_ptp, ref_ptp)
+    assert det.n_epochs == len(data)
+    assert det.n_rejected == int(det.online_decisions().sum())
+
+
+def test_online_detector_bounded_memory_by_default():
+    epochs = _ocular_epochs(n=50, seed=1)
+    det = OnlineOcularDetector(epochs.ch_names, epochs.times)
+    det.update(epochs.get_data())
+    assert det.n_epochs == 50
+    with pytest.raises(ValueError):
+        det.finalize(verbose=False)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Testy tabel pików ERP (src.erp.peaks) względem pierwotnych pętli po kanałach."""
+
+import numpy as np
+import pandas as pd
+import mne
+import pytest
+
+from src.erp.constants import EVENT_DICT, PEAK_WINDOWS, VALIDATED_PEAK_PARAMS
+from src.erp.peaks import CHANNELS, CONDITION_LABELS, find_peaks_simple, find_peaks_cohort, find_peaks_validated
+
+SFREQ = 400.0
+
+
+def _random_evokeds(seed=0):
+    """Evoked każdego warunku (-200..800 ms, 400 Hz): szum + P1/N1/P3 o losowych latencjach, w V."""
+    rng = np.random.default_rng(seed)
+    times = np.arange(-80, 321) / SFREQ
+    t_ms = times * 1000
+    info = mne.create_info(CHANNELS + ["Fz"], SFREQ, "eeg")
+    out = {}
+    for cond in EVENT_DICT:
+        data = rng.standard_normal((len(info.ch_names), len(times))) * 1.5
+        for mu, sigma, amp in ((110, 10, 4), (165, 12, -5), (350, 60, 6)):
+            lat = mu + rng.normal(0, 15, size=(len(info.ch_names), 1))
+            data += amp * rng.uniform(0.2, 1.5, size=(len(info.ch_names), 1)) * np.exp(-0.5 * ((t_ms - lat) / sigma) ** 2)
+        out[cond] = mne.EvokedArray(data * 1e-6, info, tmin=times[0], nave=20, verbose=False)
+    return out
+
+
+def _find_peaks_simple_reference(evoked_dict, channels, peak_windows):
+    """Pierwotna implementacja find_peaks_simple: maska okna i argmax/argmin osobno dla każdego kanału."""
+    results = []
+    for cond_name, cond_label in CONDITION_LABELS:
+        evoked = evoked_dict[cond_name]
+        for ch in channels:
+            data_uV = evoked.data[evoked.ch_names.index(ch), :] * 1e6
+            times_ms = evoked.times * 1000
+            row = {"Warunek": cond_label, "Kanał": ch}
+            for comp_name, (tmin, tmax) in peak_windows.items():
+                mask = (times_ms >= tmin) & (times_ms <= tmax)
+                if not np.any(mask):
+                    row[f"{comp_name}_Amp_uV"] = np.nan
+                    row[f"{comp_name}_Lat_ms"] = np.nan
+                    continue
+                w_data, w_times = data_uV[mask], times_ms[mask]
+                peak_idx = np.argmax(w_data) if comp_name.startswith("P") else np.argmin(w_data)
+                row[f"{comp_name}_Amp_uV"] = np.round(w_data[peak_idx], 2)
+                row[f"{comp_name}_Lat_ms"] = np.round(w_times[peak_idx], 1)
+            results.append(row)
+    return pd.DataFrame(results)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_find_peaks_simple_matches_reference(seed):
+    evokeds = _random_evokeds(seed)
+    expected = _find_peaks_simple_reference(evokeds, CHANNELS, PEAK_WINDOWS)
+    df = find_peaks_simple(evokeds, verbose=False)
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+
+def test_find_peaks_simple_empty_window():
+    evokeds = _random_evokeds(3)
+    # okno między próbkami (co 2.5 ms) i okno poza zapisem -> NaN; pozostałe bez zmian
+    windows = dict(PEAK_WINDOWS, N70=(101.0, 101.5), P3=(900, 1000))
+    expected = _find_peaks_simple_reference(evokeds, ["O1", "C4"], windows)
+    df = find_peaks_simple(evokeds, channels=["O1", "C4"], peak_windows=windows, verbose=False)
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    assert df[["N70_Amp_uV", "N70_Lat_ms", "P3_Amp_uV", "P3_Lat_ms"]].isna().all().all()
+
+
+def test_find_peaks_cohort_matches_per_subject():
+    subjects = {f"S{i}": _random_evokeds(10 + i) for i in range(3)}
+    df = find_peaks_cohort(subjects)
+    for subject, evokeds in subjects.items():
+        part = df[df["Badany"] == subject].drop(columns="Badany").reset_index(drop=True)
+        pd.testing.assert_frame_equal(part, _find_peaks_simple_reference(evokeds, CHANNELS, PEAK_WINDOWS),
+                                      check_dtype=False)
+
+
+def _validated_reference(data_uV, times_ms, params):
+    """Pierwotna _find_peaks_validated (jeden kanał): P1 -> N1 -> P3 z zagnieżdżonymi maskami."""
+    out = {}
+    mask_p1 = (times_ms >= params["p1_window"][0]) & (times_ms <= params["p1_window"][1])
+    if np.any(mask_p1):
+        p1_data, p1_times = data_uV[mask_p1], times_ms[mask_p1]
+        p1_idx = np.argmax(p1_data)
+        p1_amp, p1_lat = p1_data[p1_idx], p1_times[p1_idx]
+        out["P1"] = (p1_amp, p1_lat)
+        mask_n1 = (times_ms >= p1_lat + params["n1_offset"]) & (times_ms <= params["n1_end"])
+        if np.any(mask_n1):
+            n1_data, n1_times = data_uV[mask_n1], times_ms[mask_n1]
+            n1_idx = np.argmin(n1_data)
+            n1_amp, n1_lat = n1_data[n1_idx], n1_times[n1_idx]
+            out["N1"] = (n1_amp, n1_lat)
+            mask_p3 = (times_ms >= n1_lat + params["p3_offset"]) & (times_ms <= params["p3_end"])
+            if np.any(mask_p3):
+                p3_data, p3_times = data_uV[mask_p3], times_ms[mask_p3]
+                p3_idx = np.argmax(p3_data)
+                p3_amp, p3_lat = p3_data[p3_idx], p3_times[p3_idx]
+                if p1_lat < n1_lat < p3_lat and abs(p3_amp) >= abs(n1_amp) * params["p3_min_ratio"]:
+                    out["P3"] = (p3_amp, p3_lat)
+    mask_n70 = (times_ms >= params["n70_window"][0]) & (times_ms <= params["n70_window"][1])
+    if np.any(mask_n70):
+        n70_data, n70_times = data_uV[mask_n70], times_ms[mask_n70]
+        n70_idx = np.argmin(n70_data)
+        out["N70"] = (n70_data[n70_idx], n70_times[n70_idx])
+    return out
+
+
+def _find_peaks_validated_reference(evoked_dict, channels, params):
+    results = []
+    for cond_name, cond_label in CONDITION_LABELS:
+        evoked = evoked_dict[cond_name]
+        for ch in channels:
+            data_uV = evoked.data[evoked.ch_names.index(ch), :] * 1e6
+            peaks = _validated_reference(data_uV, evoked.times * 1000, params)
+            row = {"Warunek": cond_label, "Kanał": ch}
+            for comp in ["N70", "P1", "N1", "P3"]:
+                amp, lat = peaks.get(comp, (np.nan, np.nan))
+                row[f"{comp}_Amp_uV"] = np.round(amp, 2)
+                row[f"{comp}_Lat_ms"] = np.round(lat, 1)
+            results.append(row)
+    return pd.DataFrame(results)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2, 3])
+def test_find_peaks_validated_matches_reference(seed):
+    evokeds = _random_evokeds(seed)
+    expected = _find_peaks_validated_reference(evokeds, CHANNELS, VALIDATED_PEAK_PARAMS)
+    df = find_peaks_validated(evokeds, verbose=False)
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("override, missing", [
+    ({"p1_window": (101.0, 101.5)}, ["P1", "N1", "P3"]),  # brak P1 -> brak N1 i P3
+    ({"n1_end": 100}, ["N1", "P3"]),                      # okno N1 puste (P1 + 20 ms > n1_end)
+    ({"p3_end": 150}, ["P3"]),                            # okno P3 puste
+    ({"p3_min_ratio": 1e6}, ["P3"]),                      # P3 zawsze za słaby względem N1
+])
+def test_find_peaks_validated_missing_branches(override, missing):
+    evokeds = _random_evokeds(5)
+    params = dict(VALIDATED_PEAK_PARAMS, **override)
+    expected = _find_peaks_validated_reference(evokeds, CHANNELS, params)
+    df = find_peaks_validated(evokeds, verbose=False, params=params)
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    assert df[[f"{c}_Amp_uV" for c in missing] + [f"{c}_Lat_ms" for c in missing]].isna().all().all()
+    assert df["N70_Amp_uV"].notna().all()
+
+
+def test_find_peaks_cohort_validated_matches_per_subject():
+    subjects = {f"S{i}": _random_evokeds(20 + i) for i in range(3)}
+    df = find_peaks_cohort(subjects, validated=True)
+    for subject, evokeds in subjects.items():
+        part = df[df["Badany"] == subject].drop(columns="Badany").reset_index(drop=True)
+        pd.testing.assert_frame_equal(part, _find_peaks_validated_reference(evokeds, CHANNELS, VALIDATED_PEAK_PARAMS),
+                                      check_dtype=False)